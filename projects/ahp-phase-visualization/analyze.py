@@ -1,20 +1,145 @@
 from datetime import time
 import pyabf
-import pyabf.tools.ap
 import numpy as np
 import matplotlib.pyplot as plt
 import pathlib
+import sys
 
 PATH_HERE = pathlib.Path(__file__).parent
 
+sys.path.append(str(PATH_HERE.parent.joinpath("shared")))
+import abfMirror  # nopep8
+import traceDecimation  # nopep8
+from abfSweeps import getSweepMatrix  # nopep8
+
 ABF_PATHS = PATH_HERE.joinpath("abfs.txt").read_text().split("\n")
 ABF_PATHS = [x for x in ABF_PATHS if ".abf" in x]
 
 PATH_OUT = PATH_HERE.joinpath("output")
-if not PATH_OUT.exists():
-    PATH_OUT.mkdir()
-for oldFile in PATH_OUT.glob("*.*"):
-    oldFile.unlink()
+
+
+def _findAPs(sweeps: np.ndarray, sampleRate: float, index1: int, index2: int,
+             dVthreshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the sweep index and point index of every AP between two indexes of
+    a (sweeps x points) array (sorted by sweep then time) without removing doubles.
+    """
+    windowPoints = 2 * int(sampleRate / 1000)
+    empty = np.array([], dtype=int)
+
+    # dV/dt (mV/ms) of the window of every sweep
+    derivs = np.diff(sweeps[:, index1:index2], axis=1) * sampleRate / 1000
+    if derivs.shape[1] < windowPoints:
+        return empty, empty
+
+    # points where dV/dt first rises above the threshold
+    isAbove = derivs > dVthreshold
+    isCrossing = isAbove.copy()
+    isCrossing[:, 1:] &= ~isAbove[:, :-1]
+    derivWindows = np.lib.stride_tricks.sliding_window_view(
+        derivs, windowPoints, axis=1)
+    sweepIndexes, crossIndexes = np.nonzero(isCrossing)
+    isComplete = crossIndexes < derivWindows.shape[1]
+    sweepIndexes = sweepIndexes[isComplete]
+    crossIndexes = crossIndexes[isComplete]
+
+    # center each AP on its peak dV/dt and require a fast repolarization
+    peakIndexes = crossIndexes + \
+        np.argmax(derivWindows[sweepIndexes, crossIndexes], axis=1)
+    isComplete = peakIndexes < derivWindows.shape[1]
+    sweepIndexes = sweepIndexes[isComplete]
+    peakIndexes = peakIndexes[isComplete]
+    isRepolarized = np.min(derivWindows[sweepIndexes, peakIndexes],
+                           axis=1) <= -dVthreshold / 2
+    sweepIndexes = sweepIndexes[isRepolarized]
+    apIndexes = peakIndexes[isRepolarized] + index1
+
+    # crossings that share a peak are one AP
+    order = np.lexsort((apIndexes, sweepIndexes))
+    isNew = np.ones(len(order), dtype=bool)
+    isNew[1:] = (np.diff(sweepIndexes[order]) != 0) | (np.diff(apIndexes[order]) != 0)
+    order = order[isNew]
+    return sweepIndexes[order], apIndexes[order]
+
+
+def _isDouble(sweepIndexes: np.ndarray, apIndexes: np.ndarray, pointsPerMs: int) -> np.ndarray:
+    """
+    Return which APs pyabf discards as doubles: in a run of APs that are each
+    less than 3 ms after the one before, every second AP is discarded.
+    """
+    isRunStart = np.ones(len(apIndexes), dtype=bool)
+    isRunStart[1:] = (np.diff(sweepIndexes) != 0) | \
+        (np.diff(apIndexes) >= 3 * pointsPerMs)
+    positions = np.arange(len(apIndexes))
+    runPositions = positions - \
+        np.maximum.accumulate(np.where(isRunStart, positions, 0))
+    return runPositions % 2 == 1
+
+
+def getFirstRampAPs(sweeps: np.ndarray,
+                    sampleRate: float,
+                    time1: float = 6,
+                    time2: float = 11,
+                    dVthreshold: float = 10) -> np.ndarray:
+    """
+    Return the index of the first AP between two times (seconds) in every sweep
+    of a (sweeps x points) array, or -1 for sweeps without an AP in that range.
+
+    APs are detected like pyabf.tools.ap.ap_points_currentSweep: dV/dt (mV/ms)
+    rises above the threshold, the AP is placed at the peak dV/dt within 2 ms,
+    dV/dt must fall below -threshold/2 within 2 ms of that peak, and an AP
+    less than 3 ms after the previous (kept) AP is discarded as a double
+    (pyabf also discards APs in the first 3 ms of a sweep that follow a double,
+    which is not reproduced). Only the ramp window (plus a few milliseconds)
+    is differentiated unless an AP near the start of the window could belong
+    to a run of doubles that began earlier, in which case that sweep is
+    analyzed from its start.
+    """
+    sweeps = np.atleast_2d(sweeps)
+    pointsPerMs = int(sampleRate / 1000)
+    index1 = max(int(time1 * sampleRate) - 5 * pointsPerMs, 0)
+    index2 = min(int(time2 * sampleRate) + 4 * pointsPerMs + 1, sweeps.shape[1])
+    sweepIndexes, apIndexes = _findAPs(sweeps, sampleRate, index1, index2, dVthreshold)
+
+    # re-analyze sweeps whose first AP is too close to the window start to know if it is a double
+    isFirst = np.ones(len(sweepIndexes), dtype=bool)
+    isFirst[1:] = np.diff(sweepIndexes) != 0
+    isEarly = isFirst & (apIndexes < index1 + 5 * pointsPerMs)
+    redoSweeps = sweepIndexes[isEarly] if index1 > 0 else []
+    if len(redoSweeps):
+        isKept = ~np.isin(sweepIndexes, redoSweeps)
+        redoSweepIndexes, redoApIndexes = _findAPs(
+            sweeps[redoSweeps], sampleRate, 0, index2, dVthreshold)
+        sweepIndexes = np.concatenate([sweepIndexes[isKept], redoSweeps[redoSweepIndexes]])
+        apIndexes = np.concatenate([apIndexes[isKept], redoApIndexes])
+        order = np.lexsort((apIndexes, sweepIndexes))
+        sweepIndexes = sweepIndexes[order]
+        apIndexes = apIndexes[order]
+
+    # keep the first AP within the time range of each sweep
+    isInRamp = (apIndexes > time1 * sampleRate) & (apIndexes <= time2 * sampleRate)
+    isValid = ~_isDouble(sweepIndexes, apIndexes, pointsPerMs) & isInRamp
+    firstIndexes = np.full(len(sweeps), -1)
+    sweepsWithAPs, firstIs = np.unique(sweepIndexes[isValid], return_index=True)
+    firstIndexes[sweepsWithAPs] = apIndexes[isValid][firstIs]
+    return firstIndexes
+
+
+def getPaddedTraces(sweeps: np.ndarray, centerIndexes: np.ndarray,
+                    sampleRate: float, padMillisec: float = 250) -> np.ndarray:
+    """
+    Return a (sweeps x points) array with the data around an index of each sweep.
+    Points beyond the edges of the sweep (and sweeps whose index is -1) are NaN.
+    """
+    sweeps = np.atleast_2d(sweeps)
+    centerIndexes = np.asarray(centerIndexes)
+    padPoints = int(padMillisec * sampleRate / 1000)
+    indexes = centerIndexes[:, np.newaxis] + np.arange(-padPoints, padPoints)
+    isValid = (indexes >= 0) & (indexes < sweeps.shape[1]) & \
+        (centerIndexes[:, np.newaxis] >= 0)
+    rows = np.arange(len(sweeps))[:, np.newaxis]
+    traces = sweeps[rows, np.clip(indexes, 0, sweeps.shape[1] - 1)]
+    return np.where(isValid, traces, np.nan)
 
 
 def getRampFirstAP(abf: pyabf.ABF,
@@ -23,16 +148,12 @@ def getRampFirstAP(abf: pyabf.ABF,
                    time2: float = 11,
                    padMillisec: float = 250) -> np.ndarray:
 
-    abf.setSweep(sweepIndex)
-    indexes = pyabf.tools.ap.ap_points_currentSweep(abf, dVthresholdPos=10)
-
-    # isolate indexes in ramp
-    rampIndexes = [x for x in indexes
-                   if x > time1 * abf.dataRate
-                   and time2 * abf.dataRate]
-    firstRampApIndex = rampIndexes[0]
+    sweep = getSweepMatrix(abf)[sweepIndex]
+    firstRampApIndex = getFirstRampAPs(sweep, abf.dataRate, time1, time2)[0]
+    if firstRampApIndex < 0:
+        raise ValueError(f"no AP in ramp of sweep {sweepIndex}")
     padPoints = int(padMillisec * abf.dataRate / 1000)
-    trace = abf.sweepY[firstRampApIndex-padPoints:firstRampApIndex+padPoints]
+    trace = sweep[firstRampApIndex-padPoints:firstRampApIndex+padPoints]
     return trace
 
 
@@ -53,9 +174,21 @@ def showTrace(trace: np.ndarray, sampleRate: float, axs, lineWidth: float, lineC
     dY = np.diff(trace)
     dY = np.append(dY, dY[-1])
 
+    # long traces are reduced to the min and max of each horizontal pixel
+    def plotDecimated(ax: plt.Axes, i1: int, i2: int, ys: np.ndarray, **kwargs):
+        pixelCount = traceDecimation.getAxesPixelWidth(ax)
+        ax.plot(*traceDecimation.decimateMinMax(xs[i1:i2], ys[i1:i2], pixelCount),
+                **kwargs)
+
+    # zoomed-in views only plot the visible points but are scaled to the full trace
+    def plotZoomed(ax: plt.Axes, ys: np.ndarray, **kwargs):
+        plotDecimated(ax, max(zoomInI1 - 1, 0), zoomInI2 + 2, ys, **kwargs)
+        ax.update_datalim([[xs[0], np.nanmin(ys)], [xs[-1], np.nanmax(ys)]])
+
     # show the full length of the trace
     ax0: plt.Axes = axs[0]
-    ax0.plot(xs, trace, lw=lineWidth, color=lineColor, label=label)
+    plotDecimated(ax0, 0, len(trace), trace,
+                  lw=lineWidth, color=lineColor, label=label)
     ax0.set_title("First AP in Ramp")
     ax0.grid(alpha=.5, ls='--')
     ax0.margins(x=0)
@@ -65,7 +198,7 @@ def showTrace(trace: np.ndarray, sampleRate: float, axs, lineWidth: float, lineC
 
     # zoom in to the center 10%
     ax1: plt.Axes = axs[1]
-    ax1.plot(xs, trace, lw=lineWidth, color=lineColor)
+    plotZoomed(ax1, trace, lw=lineWidth, color=lineColor)
     ax1.set_title("Fast Component")
     ax1.axis([-zoomInPad, +zoomInPad, None, None])
     ax1.grid(alpha=.5, ls='--')
@@ -76,7 +209,7 @@ def showTrace(trace: np.ndarray, sampleRate: float, axs, lineWidth: float, lineC
     # first derivative
     ax2: plt.Axes = axs[2]
     ax2.set_title("Derivative")
-    ax2.plot(xs, dY, lw=lineWidth, color=lineColor)
+    plotZoomed(ax2, dY, lw=lineWidth, color=lineColor)
     ax2.axis([-zoomInPad, +zoomInPad, None, None])
     ax2.grid(alpha=.5, ls='--')
     ax2.margins(x=0)
@@ -104,7 +237,12 @@ def makeIndex(folderPath: pathlib.Path):
 
 if __name__ == "__main__":
 
-    for abfPath in ABF_PATHS:
+    if not PATH_OUT.exists():
+        PATH_OUT.mkdir()
+    for oldFile in PATH_OUT.glob("*.*"):
+        oldFile.unlink()
+
+    for abfPath in abfMirror.getMirror().iterate(ABF_PATHS):
         abf = pyabf.ABF(abfPath)
         tagSweep = int(abf.tagSweeps[0])
         print(f"\n{abf.abfID}")
@@ -115,14 +253,17 @@ if __name__ == "__main__":
         drugTimeMin = drugSweep * abf.sweepLengthSec / 60
         print(f"baseline @ {baselineTimeMin} min, drug @ {drugTimeMin} min")
 
+        sweeps = getSweepMatrix(abf)[[baselineSweep, drugSweep]]
+        apIndexes = getFirstRampAPs(sweeps, abf.dataRate)
+        if np.any(apIndexes < 0):
+            raise ValueError(f"no AP in ramp of sweeps {baselineSweep} and {drugSweep}")
+        traces = getPaddedTraces(sweeps, apIndexes, abf.dataRate)
+
         fig, axs = plt.subplots(nrows=1, ncols=4, figsize=(15, 4))
         fig.suptitle(abf.abfID)
 
-        trace = getRampFirstAP(abf, baselineSweep)
-        showTrace(trace, abf.dataRate, axs, 3, '#8cb9e6', "control")
-
-        trace = getRampFirstAP(abf, drugSweep)
-        showTrace(trace, abf.dataRate, axs, 1, 'k', "TGOT")
+        showTrace(traces[0], abf.dataRate, axs, 3, '#8cb9e6', "control")
+        showTrace(traces[1], abf.dataRate, axs, 1, 'k', "TGOT")
 
         plt.tight_layout()
 
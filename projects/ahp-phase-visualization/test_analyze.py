@@ -0,0 +1,57 @@
+import warnings
+import numpy as np
+import pyabf
+import analyze
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    import pyabf.tools.ap
+
+SAMPLE_RATE = 20_000
+
+
+def addSpike(ys, index):
+    """a 1 ms rise of 80 mV followed by a 2 ms fall back to the ramp"""
+    rise = int(SAMPLE_RATE / 1000)
+    ys[index:index+rise] += np.linspace(0, 80, rise)
+    ys[index+rise:index+3*rise] += np.linspace(80, 0, 2*rise)
+
+
+def getRampSweeps(seed=0):
+    """12 second sweeps with a depolarizing ramp from 6 to 11 seconds"""
+    rng = np.random.default_rng(seed)
+    times = np.arange(12 * SAMPLE_RATE) / SAMPLE_RATE
+    ramp = -70 + 30 * np.clip((times - 6) / 5, 0, 1)
+    sweeps = np.tile(ramp, (8, 1))
+    spikeTimes = [
+        [6.5, 7, 8],  # regular spikes
+        [2, 9.5],  # a spike before the ramp
+        [],  # no spikes
+        [5.999, 7.5],  # a spike just before the ramp
+        [6.0005, 8.1],  # a spike right at the start of the ramp
+        [7, 7.002, 7.004, 9],  # doubles are discarded
+        [5.996, 5.998, 6.0005, 10],  # a run of doubles crossing the ramp start
+        [10.999, 11.5],  # a spike at the end of the ramp
+    ]
+    for sweep, times in zip(sweeps, spikeTimes):
+        for time in times:
+            addSpike(sweep, int(time * SAMPLE_RATE))
+    return sweeps + rng.normal(0, .05, sweeps.shape)
+
+
+def getFirstRampApWithPyabf(sweep, time1=6, time2=11):
+    abf = object.__new__(pyabf.ABF)
+    abf.sweepY = sweep
+    abf.dataRate = SAMPLE_RATE
+    abf.dataPointsPerMs = int(SAMPLE_RATE / 1000)
+    indexes = pyabf.tools.ap.ap_points_currentSweep(abf, dVthresholdPos=10)
+    indexes = [x for x in indexes
+               if x > time1 * SAMPLE_RATE and x <= time2 * SAMPLE_RATE]
+    return indexes[0] if indexes else -1
+
+
+def test_first_ramp_APs_match_pyabf():
+    sweeps = getRampSweeps()
+    expected = [getFirstRampApWithPyabf(sweep) for sweep in sweeps]
+    assert list(analyze.getFirstRampAPs(sweeps, SAMPLE_RATE)) == expected
+    assert expected[2] == -1
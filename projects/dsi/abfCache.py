@@ -0,0 +1,80 @@
+"""
+This file contains a per-run cache of decoded ABF data so each file
+is read and scaled only once no matter how many figures use it.
+"""
+
+import collections
+import pathlib
+import sys
+import pyabf
+import pyabf.tools.memtest
+import numpy as np
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import abfMirror  # nopep8
+import abfSweeps  # nopep8
+
+
+class AbfDataCache:
+    """
+    Least-recently-used cache of fully-loaded ABFs bounded by the total
+    size of their data arrays. Memtest results are cached separately
+    because they are small and expensive to compute.
+    """
+
+    def __init__(self, maxBytes: int = 2_000_000_000):
+        self.maxBytes = maxBytes
+        self.abfs = collections.OrderedDict()
+        self.ras = {}
+        self.loadCount = 0
+
+    @property
+    def sizeBytes(self) -> int:
+        return sum(abf.data.nbytes for abf in self.abfs.values())
+
+    def getAbf(self, abfPath: pathlib.Path) -> pyabf.ABF:
+        """
+        Return a fully-loaded ABF, reading it from disk only if it is not cached.
+        """
+        key = str(abfPath)
+        if key in self.abfs:
+            self.abfs.move_to_end(key)
+            return self.abfs[key]
+
+        abf = pyabf.ABF(abfMirror.getMirror().resolve(abfPath))
+        self.loadCount += 1
+        self.abfs[key] = abf
+        self._evict()
+        return abf
+
+    def prefetch(self, abfPaths: list[pathlib.Path]):
+        """
+        Start copying ABFs into the local mirror (if one is configured)
+        so they are ready by the time they are loaded.
+        """
+        abfMirror.getMirror().prefetch(abfPaths)
+
+    def _evict(self):
+        """
+        Drop least recently used ABFs until the cache fits in memory.
+        The most recently added ABF is always kept.
+        """
+        while len(self.abfs) > 1 and self.sizeBytes > self.maxBytes:
+            self.abfs.popitem(last=False)
+
+    def getSweeps(self, abfPath: pathlib.Path, channel: int = 0) -> np.ndarray:
+        """
+        Return a read-only (sweeps x points) view of the scaled data for one channel.
+        """
+        sweeps = abfSweeps.getSweepMatrix(self.getAbf(abfPath), channel)
+        sweeps.flags.writeable = False
+        return sweeps
+
+    def getRa(self, abfPath: pathlib.Path) -> np.ndarray:
+        """
+        Return the access resistance (MΩ) of every sweep according to memtest.
+        """
+        key = str(abfPath)
+        if key not in self.ras:
+            memtest = pyabf.tools.memtest.Memtest(self.getAbf(abfPath))
+            self.ras[key] = np.array(memtest.Ra.values)
+        return self.ras[key]
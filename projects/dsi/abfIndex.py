@@ -0,0 +1,98 @@
+"""
+This file maintains a persistent header-only metadata index for a folder of ABFs.
+
+The index is stored as JSON in the folder's _autoanalysis subfolder.
+Headers are only re-read for ABFs that are new or whose size or
+modification time changed since the index was last saved.
+"""
+
+import os
+import pathlib
+import sys
+import pyabf
+from dataclasses import dataclass, asdict
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import atomicFiles  # nopep8
+
+INDEX_VERSION = 1
+INDEX_FILENAME = "abfIndex.json"
+
+
+@dataclass
+class AbfInfo:
+    """
+    Header metadata for a single ABF file
+    """
+    filename: str
+    size: int
+    mtime: float
+    abfID: str
+    protocol: str
+    sweepCount: int
+    sampleRate: int
+    tagTimesMin: list[float]
+
+
+def readAbfInfo(abfPath: pathlib.Path, stat: os.stat_result) -> AbfInfo:
+    """
+    Read the header of an ABF and return its metadata.
+    """
+    abf = pyabf.ABF(abfPath, loadData=False)
+    return AbfInfo(
+        filename=abfPath.name,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        abfID=abf.abfID,
+        protocol=abf.protocol,
+        sweepCount=int(abf.sweepCount),
+        sampleRate=int(abf.sampleRate),
+        tagTimesMin=[float(x) for x in abf.tagTimesMin])
+
+
+def _loadIndexFile(indexPath: pathlib.Path) -> dict[str, AbfInfo]:
+    data = atomicFiles.readVersionedJson(indexPath, INDEX_VERSION)
+    if data is None:
+        return {}
+    return {x["filename"]: AbfInfo(**x) for x in data["abfs"]}
+
+
+def _saveIndexFile(indexPath: pathlib.Path, infos: list[AbfInfo]):
+    if not indexPath.parent.exists():
+        indexPath.parent.mkdir()
+    atomicFiles.writeJson(
+        indexPath, {"version": INDEX_VERSION, "abfs": [asdict(x) for x in infos]})
+
+
+def loadIndex(folder: pathlib.Path, indexPath: pathlib.Path = None) -> list[AbfInfo]:
+    """
+    Return metadata for every ABF in the folder sorted by filename.
+    Cached entries are reused when the file size and modification time
+    are unchanged, so only new or modified ABFs have their headers read.
+    """
+    if indexPath is None:
+        indexPath = folder.joinpath("_autoanalysis", INDEX_FILENAME)
+
+    cached = _loadIndexFile(indexPath)
+
+    entries = sorted((x for x in os.scandir(folder)
+                      if x.is_file() and x.name.lower().endswith(".abf")),
+                     key=lambda x: x.name)
+
+    infos = []
+    readCount = 0
+    for entry in entries:
+        stat = entry.stat()
+        info = cached.get(entry.name)
+        if info is None or info.size != stat.st_size or info.mtime != stat.st_mtime:
+            info = readAbfInfo(pathlib.Path(entry.path), stat)
+            readCount += 1
+        infos.append(info)
+
+    removedCount = len(set(cached) - set(x.filename for x in infos))
+    print(f"indexed {len(infos)} ABFs ({readCount} headers read, " +
+          f"{removedCount} removed)")
+
+    if readCount or removedCount:
+        _saveIndexFile(indexPath, infos)
+
+    return infos
@@ -1,58 +1,86 @@
+import concurrent.futures
+import os
 import pathlib
-import pyabf
-import pyabf.tools.memtest
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
 from dataclasses import dataclass
+import abfIndex
+import abfCache
+import dsiTools
+import manifest
+from dsiTools import DsiTriplet
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import traceDecimation  # nopep8
+import plotWorkers  # nopep8
 
+# horizontal space between triplets in the repeated triplet figure (seconds)
+TRIPLET_SPACING = .2
 
-@dataclass
-class DsiTriplet:
+# figures recorded in the manifest with another version are drawn again
+FIGURE_VERSION = 1
+
+# ABF data shared by every cell a worker process analyzes (see initWorker)
+_workerCache = None
+
+
+def initWorker():
+    """
+    Prepare a worker process to analyze cells: render figures without a display
+    and create one bounded ABF cache used for every cell the worker analyzes.
+    """
+    global _workerCache
+    plotWorkers.initWorker()
+    _workerCache = abfCache.AbfDataCache()
+
+
+def getFigureParameters() -> dict:
     """
-    Holds paths for 3 ABFs composing a DSI set:
-        path1 - baseline
-        path2 - depolarization
-        path3 - recovery
+    Return every setting that affects figures (including analysis settings).
     """
-    parent: str
-    path1: pathlib.Path
-    path2: pathlib.Path
-    path3: pathlib.Path
+    return {
+        "version": FIGURE_VERSION,
+        "tripletSpacing": TRIPLET_SPACING,
+        "analysis": dsiTools.getAnalysisParameters(),
+    }
 
 
 def getDsiTriplets(folder: pathlib.Path) -> dict[str, list[DsiTriplet]]:
     """
     Return a list of DSI triplets for each parent.
+    Headers come from the folder's metadata index (see abfIndex.py)
+    and triplets are found in a single pass over the sorted ABF list.
     """
-    abfPaths = list(folder.glob("*.abf"))
-    print(f"reading headers of {len(abfPaths)} ABFs...")
+    infos = abfIndex.loadIndex(folder)
+    tifNames = set(x.stem for x in folder.glob("*.tif"))
 
     tripletsByParent = {}
 
     parent = "orphan"
-    for abfPath in abfPaths:
-        tifPath = pathlib.Path(str(abfPath)[:-4]+".tif")
-        if (tifPath.exists()):
-            parent = abfPath.name[:-4]
-        abf = pyabf.ABF(abfPath, loadData=False)
-        if (abf.protocol.startswith("0612")):
+    for i, info in enumerate(infos):
+        abfName = pathlib.Path(info.filename).stem
+        if (abfName in tifNames):
+            parent = abfName
+        if (info.protocol.startswith("0612")):
 
-            abfPathPrevious = abfPaths[abfPaths.index(abfPath)-1]
-            abf1 = pyabf.ABF(abfPathPrevious, False)
-            expectedProtocolPrevious = abf1.protocol.startswith("0611")
+            infoPrevious = infos[i-1] if i > 0 else None
+            expectedProtocolPrevious = infoPrevious is not None and \
+                infoPrevious.protocol.startswith("0611")
 
-            abfPathNext = abfPaths[abfPaths.index(abfPath)+1]
-            abf3 = pyabf.ABF(abfPathNext, False)
-            expectedProtocolNext = abf3.protocol.startswith("0613")
+            infoNext = infos[i+1] if i + 1 < len(infos) else None
+            expectedProtocolNext = infoNext is not None and \
+                infoNext.protocol.startswith("0613")
 
             if expectedProtocolPrevious and expectedProtocolNext:
                 triplet = DsiTriplet(parent,
-                                     abfPathPrevious, abfPath, abfPathNext)
+                                     folder.joinpath(infoPrevious.filename),
+                                     folder.joinpath(info.filename),
+                                     folder.joinpath(infoNext.filename))
                 tripletsByParent.setdefault(parent, []).append(triplet)
 
             if not expectedProtocolPrevious or not expectedProtocolNext:
-                print(
-                    f"WARNING - DSI ABF with unexpected adjacent ABF: {abfPath}")
+                print("WARNING - DSI ABF with unexpected adjacent ABF: " +
+                      str(folder.joinpath(info.filename)))
 
     tripletCount = sum([len(v) for (k, v) in tripletsByParent.items()])
     parentCount = len(tripletsByParent.keys())
@@ -61,60 +89,52 @@ def getDsiTriplets(folder: pathlib.Path) -> dict[str, list[DsiTriplet]]:
     return tripletsByParent
 
 
-def plotEvokedTrace(segment: np.ndarray, segmentXs: np.ndarray, xOffset: float, color: str):
+def plotEvokedTrace(segment: np.ndarray, segmentXs: np.ndarray, xOffset: float, color: str,
+                    pixelCount: int = None):
     xs = segmentXs + xOffset
     minI = np.nanargmin(segment)
     minY = segment[minI]
     minX = xs[minI]
+    if pixelCount:
+        xs, segment = traceDecimation.decimateMinMax(xs, segment, pixelCount)
     plt.plot(xs, segment, '-', color=color)
     plt.plot(minX, minY, 'r.', ms=15, alpha=.5)
 
 
-def PlotTriplet(triplet: DsiTriplet, xOffset: float):
+def PlotTriplet(traces: dsiTools.TripletTraces, xOffset: float, pixelCount: int = None):
     """
-    Given an ABF triplet, plot the mean of the first ABF
+    Given the measured segments of an ABF triplet, plot the mean of the first ABF
     and the first sweep of the last ABF on top of it.
     Traces will be plotted onto an existing future.
     Apply a horizontal offset (in seconds).
+    If the width of the traces in pixels is given they are decimated to that resolution.
     """
 
-    artifactPoint1 = 28936
-    artifactPoint2 = 28970
-
-    segmentTime1 = 1.420
-    segmentTime2 = 1.550
+    baselineMean = traces.baselineMean
+    segmentXs = np.arange(len(baselineMean)) / traces.sampleRate + xOffset
 
-    abf1 = pyabf.ABF(triplet.path1)
-    segmentPoint1 = int(abf1.sampleRate * segmentTime1)
-    segmentPoint2 = int(abf1.sampleRate * segmentTime2)
-    segmentPointCount = segmentPoint2 - segmentPoint1
-    segmentXs = np.arange(segmentPointCount) / abf1.sampleRate + xOffset
-
-    baselineSegments = np.zeros((abf1.sweepCount, segmentPointCount))
-    for sweepIndex in range(abf1.sweepCount):
-        abf1.setSweep(sweepIndex, baseline=[1.3, 1.4])
-        abf1.sweepY[artifactPoint1:artifactPoint2] = np.nan
-        baselineSegments[sweepIndex] = abf1.sweepY[segmentPoint1:segmentPoint2]
-
-    baselineMean = np.mean(baselineSegments, axis=0)
     minI = np.nanargmin(baselineMean)
     label = "mean sweep before DSI" if xOffset == 0 else None
-    plt.plot(segmentXs, baselineMean, '-',
+    plotXs, plotYs = segmentXs, baselineMean
+    if pixelCount:
+        plotXs, plotYs = traceDecimation.decimateMinMax(
+            segmentXs, baselineMean, pixelCount)
+    plt.plot(plotXs, plotYs, '-',
              color='k', label=label, alpha=.5, lw=2)
     plt.plot(segmentXs[minI], baselineMean[minI],
              '.', ms=20, mfc='none', color='k', mew=2)
 
-    abf3 = pyabf.ABF(triplet.path3)
-    abf3.setSweep(0, baseline=[1.3, 1.4])
-    abf3.sweepY[artifactPoint1:artifactPoint2] = np.nan
-    segment = abf3.sweepY[segmentPoint1:segmentPoint2]
-    minI = np.nanargmin(baselineMean)
+    segment = traces.recovery
     label = "first sweep after DSI" if xOffset == 0 else None
-    plt.plot(segmentXs, segment, '-', color='k', label=label, alpha=1, lw=1)
+    plotXs, plotYs = segmentXs, segment
+    if pixelCount:
+        plotXs, plotYs = traceDecimation.decimateMinMax(
+            segmentXs, segment, pixelCount)
+    plt.plot(plotXs, plotYs, '-', color='k', label=label, alpha=1, lw=1)
     plt.plot(segmentXs[minI], segment[minI], '.', ms=20, color='k')
 
 
-def createRepeatedTripletFigure(tripletList: list[DsiTriplet], saveAs: str):
+def createRepeatedTripletFigure(parent: str, tracesList: list[dsiTools.TripletTraces], saveAs: str):
     """
     Generate figures a figure showing each triplet in the given list.
     This figure represents all DSI runs for a single cell.
@@ -122,11 +142,19 @@ def createRepeatedTripletFigure(tripletList: list[DsiTriplet], saveAs: str):
 
     plt.figure(figsize=(10, 6))
 
-    for i, triplet in enumerate(tripletList):
-        PlotTriplet(triplet, xOffset=.2 * i)
+    # each triplet occupies a fraction of the width of the axes
+    pixelCount = None
+    if len(tracesList):
+        segmentDuration = len(tracesList[0].baselineMean) / tracesList[0].sampleRate
+        totalDuration = TRIPLET_SPACING * (len(tracesList) - 1) + segmentDuration
+        pixelCount = traceDecimation.getAxesPixelWidth(plt.gca()) * \
+            segmentDuration / totalDuration
+
+    for i, traces in enumerate(tracesList):
+        PlotTriplet(traces, xOffset=TRIPLET_SPACING * i, pixelCount=pixelCount)
 
     plt.grid(alpha=.5, ls='--')
-    plt.title(f"Parent: {tripletList[0].parent}")
+    plt.title(f"Parent: {parent}")
     plt.ylabel("Δ Current (pA)")
     plt.gca().get_xaxis().set_visible(False)
     plt.legend(loc="lower right")
@@ -141,31 +169,21 @@ def createRepeatedTripletFigure(tripletList: list[DsiTriplet], saveAs: str):
     plt.close()
 
 
-def createAccessFigure(tripletList: list[DsiTriplet], saveAs: str):
+def createAccessFigure(parent: str, metricsList: list[dsiTools.TripletMetrics], saveAs: str):
     """
     Generate figures showing Ra for each baseline ABF in all sets
     """
 
     plt.figure(figsize=(6, 4))
 
-    xs = []
-    ys = []
-    yErrs = []
-
-    for i, triplet in enumerate(tripletList):
-        abf = pyabf.ABF(triplet.path1)
-        memtest = pyabf.tools.memtest.Memtest(abf)
-        resistances = [x for x in memtest.Ra.values]
-        mean = np.mean(resistances)
-        stderr = np.std(resistances) / np.sqrt(len(resistances))
-        xs.append(i)
-        ys.append(mean)
-        yErrs.append(stderr)
+    xs = [x.tripletIndex for x in metricsList]
+    ys = [x.raMean for x in metricsList]
+    yErrs = [x.raStdErr for x in metricsList]
 
     plt.errorbar(xs, ys, yErrs, fmt='-o', color='r', capsize=5)
 
     plt.grid(alpha=.5, ls='--')
-    plt.title(f"Parent: {tripletList[0].parent}")
+    plt.title(f"Parent: {parent}")
     plt.ylabel("Access Resistance (MΩ)")
     plt.gca().get_xaxis().set_visible(False)
     plt.legend(loc="lower right")
@@ -181,32 +199,172 @@ def createAccessFigure(tripletList: list[DsiTriplet], saveAs: str):
     plt.close()
 
 
-def analyzeFolder(abfFolder: pathlib.Path):
+def analyzeParent(parent: str, tripletList: list[DsiTriplet], outputFolder: pathlib.Path,
+                  plot: bool = True, cache: abfCache.AbfDataCache = None
+                  ) -> tuple[list[dsiTools.TripletMetrics], dsiTools.ParentMetrics]:
     """
-    Generate auto-analysis figures for every cell in a folder.
-    Each cell has many DSI sets, and a single figure will be made
-    for each cell (showing all DSI sets for that cell).
+    Measure every triplet of a single cell and optionally generate its figures.
+    Cells are independent, so analyzeFolder runs one call per cell on its pool.
+    ABFs are loaded through the given cache, or the cache of the worker process
+    (see initWorker), so ABFs shared with other cells are not read again.
     """
-    outputFolder = abfFolder.joinpath("_autoanalysis")
+    if cache is None:
+        cache = _workerCache if _workerCache is not None else abfCache.AbfDataCache()
+    cache.prefetch([triplet.path1 for triplet in tripletList] +
+                   [triplet.path3 for triplet in tripletList])
 
-    for parent, tripletList in getDsiTriplets(abfFolder).items():
+    tripletMetrics = []
+    tripletTraces = []
+    for i, triplet in enumerate(tripletList):
+        metrics, traces = dsiTools.measureTriplet(triplet, i, cache)
+        tripletMetrics.append(metrics)
+        tripletTraces.append(traces)
 
-        print()
-        print(parent)
-        if (len(tripletList) < 3):
-            print(f"Skipping because only {len(tripletList)} triplets")
-            continue
+    parentMetrics = dsiTools.summarizeParent(parent, tripletMetrics)
 
-        createRepeatedTripletFigure(tripletList,
+    if plot:
+        createRepeatedTripletFigure(parent, tripletTraces,
                                     saveAs=outputFolder.joinpath(parent+"_dsi2.png"))
 
-        createAccessFigure(tripletList,
+        createAccessFigure(parent, tripletMetrics,
                            saveAs=outputFolder.joinpath(parent+"_ra.png"))
 
+    return tripletMetrics, parentMetrics
+
+
+@dataclass
+class FolderResults:
+    """
+    Columnar results for every analyzed cell in a folder
+    and the errors of cells that could not be analyzed
+    """
+    triplets: np.ndarray
+    parents: np.ndarray
+    errors: dict[str, Exception]
+
+
+def getOutputPaths(parent: str, outputFolder: pathlib.Path) -> list[pathlib.Path]:
+    """
+    Return the figure files generated for a parent.
+    """
+    return [outputFolder.joinpath(parent+"_dsi2.png"),
+            outputFolder.joinpath(parent+"_ra.png")]
+
+
+def analyzeFolder(abfFolder: pathlib.Path, workers: int = 1, plot: bool = True,
+                  force: bool = False, hashInputs: bool = False) -> FolderResults:
+    """
+    Measure every cell in a folder and save the results as CSV tables.
+    Each cell has many DSI sets, and if plot is True a single figure will be made
+    for each cell (showing all DSI sets for that cell).
+
+    If workers is greater than 1 each cell is analyzed as an independent
+    job on a process pool. A failure in one cell is reported and does not
+    stop the others.
+
+    Cells whose ABFs and analysis parameters are unchanged since the last run
+    (according to the manifest in the output folder) are not analyzed again
+    unless force is True or plot is True and their figures are missing or
+    were made by an older version of the plotting code. If hashInputs is True file contents are hashed
+    in addition to comparing size and modification time.
+    """
+    outputFolder = abfFolder.joinpath("_autoanalysis")
+    if not outputFolder.exists():
+        outputFolder.mkdir()
+
+    jobs = {}
+    for parent, tripletList in getDsiTriplets(abfFolder).items():
+        if (len(tripletList) < 3):
+            print(f"Skipping {parent} because only {len(tripletList)} triplets")
+            continue
+        jobs[parent] = tripletList
+
+    analysisManifest = manifest.AnalysisManifest(
+        outputFolder.joinpath(manifest.MANIFEST_FILENAME))
+    parameters = dsiTools.getAnalysisParameters()
+    figureParameters = getFigureParameters()
+
+    results = {}
+    errors = {}
+    inputsByParent = {}
+    staleJobs = {}
+    for parent, tripletList in jobs.items():
+        inputs = manifest.getTripletFingerprints(tripletList, hashInputs)
+        outputs = getOutputPaths(parent, outputFolder)
+        isCurrent = analysisManifest.isCurrent(parent, inputs, parameters)
+        if plot:
+            isCurrent = isCurrent and analysisManifest.isFigureCurrent(
+                parent, inputs, figureParameters, outputs)
+        if not force and isCurrent:
+            results[parent] = analysisManifest.getResults(parent)
+        else:
+            inputsByParent[parent] = inputs
+            staleJobs[parent] = tripletList
+    print(f"{len(results)} parents are up to date, {len(staleJobs)} need analysis")
+
+    if workers <= 1:
+        cache = abfCache.AbfDataCache()
+        for parent, tripletList in staleJobs.items():
+            print()
+            print(parent)
+            try:
+                results[parent] = analyzeParent(
+                    parent, tripletList, outputFolder, plot, cache)
+            except Exception as ex:
+                print(f"ERROR analyzing {parent}: {ex}")
+                errors[parent] = ex
+                plt.close("all")
+
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=initWorker) as executor:
+            futures = {executor.submit(analyzeParent, parent, tripletList, outputFolder, plot): parent
+                       for parent, tripletList in staleJobs.items()}
+            for future in concurrent.futures.as_completed(futures):
+                parent = futures[future]
+                try:
+                    results[parent] = future.result()
+                    print(f"finished {parent}")
+                except Exception as ex:
+                    print(f"ERROR analyzing {parent}: {ex}")
+                    errors[parent] = ex
+
+    print(f"Analyzed {len(staleJobs) - len(errors)} parents ({len(errors)} errors)")
+
+    for parent in staleJobs.keys():
+        if parent in results:
+            analysisManifest.record(parent, inputsByParent[parent], parameters,
+                                    results[parent][0], results[parent][1])
+            if plot:
+                analysisManifest.recordFigures(parent, inputsByParent[parent], figureParameters,
+                                               getOutputPaths(parent, outputFolder))
+    analysisManifest.save()
+
+    tripletMetrics = []
+    parentMetrics = []
+    for parent in jobs.keys():
+        if parent in results:
+            tripletMetrics.extend(results[parent][0])
+            parentMetrics.append(results[parent][1])
+
+    dsiTools.saveMetricsCsv(tripletMetrics, outputFolder.joinpath("dsi_triplets.csv"))
+    dsiTools.saveMetricsCsv(parentMetrics, outputFolder.joinpath("dsi_parents.csv"))
+
+    return FolderResults(dsiTools.metricsToArray(tripletMetrics),
+                         dsiTools.metricsToArray(parentMetrics),
+                         errors)
+
+
+def quantifyFolder(abfFolder: pathlib.Path, workers: int = 1) -> FolderResults:
+    """
+    Measure every cell in a folder without rendering any figures.
+    """
+    return analyzeFolder(abfFolder, workers, plot=False)
+
 
 if __name__ == "__main__":
     #analyzeFolder(pathlib.Path(R"X:/Data/SD/DSI/PFC/abfs"))
-    analyzeFolder(pathlib.Path(R"X:/Data/SD/DSI/CA1/DIC-1"))
+    analyzeFolder(pathlib.Path(R"X:/Data/SD/DSI/CA1/DIC-1"),
+                  workers=os.cpu_count())
     #analyzeFolder(pathlib.Path(R"X:/Data/SD/DSI/CA1/ABFs"))
     #analyzeFolder(pathlib.Path(R"X:/Data/SD/DSI/CA1/Coronal"))
     print("DONE")
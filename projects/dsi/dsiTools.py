@@ -0,0 +1,216 @@
+"""
+This file contains compute-only helpers for DSI analysis.
+Functions operate on whole (sweeps x points) arrays at once
+and nothing here depends on matplotlib.
+"""
+
+import csv
+import dataclasses
+import pathlib
+import numpy as np
+from dataclasses import dataclass
+import abfCache
+
+# points blanked to hide the stimulus artifact
+ARTIFACT_POINT_1 = 28936
+ARTIFACT_POINT_2 = 28970
+
+# time range (seconds) containing the evoked response
+SEGMENT_TIME_1 = 1.420
+SEGMENT_TIME_2 = 1.550
+
+# time range (seconds) used to baseline-subtract each sweep
+BASELINE_TIME_1 = 1.3
+BASELINE_TIME_2 = 1.4
+
+# part of getAnalysisParameters(), so a new version re-analyzes every parent
+ANALYSIS_VERSION = 1
+
+
+def getAnalysisParameters() -> dict:
+    """
+    Return every setting that affects analysis results.
+    """
+    return {
+        "version": ANALYSIS_VERSION,
+        "artifactPoints": [ARTIFACT_POINT_1, ARTIFACT_POINT_2],
+        "segmentTimes": [SEGMENT_TIME_1, SEGMENT_TIME_2],
+        "baselineTimes": [BASELINE_TIME_1, BASELINE_TIME_2],
+    }
+
+
+def getSegments(sweeps: np.ndarray, sampleRate: int,
+                segmentTimes: tuple[float, float] = (SEGMENT_TIME_1, SEGMENT_TIME_2),
+                baselineTimes: tuple[float, float] = (BASELINE_TIME_1, BASELINE_TIME_2),
+                blankPoints: tuple[int, int] = (ARTIFACT_POINT_1, ARTIFACT_POINT_2)) -> np.ndarray:
+    """
+    Return the segment window of every sweep as a (sweeps x points) array.
+
+    Each sweep has the mean of its baseline window subtracted and the artifact
+    points (indexes relative to the start of the sweep) replaced with NaN.
+    If no baseline or blanking is requested a view of the input is returned.
+    A 1D input is treated as a single sweep.
+    """
+    sweeps = np.atleast_2d(sweeps)
+
+    segmentPoint1 = int(sampleRate * segmentTimes[0])
+    segmentPoint2 = int(sampleRate * segmentTimes[1])
+    segments = sweeps[:, segmentPoint1:segmentPoint2]
+
+    if baselineTimes is None and blankPoints is None:
+        return segments
+
+    if baselineTimes is not None:
+        baselinePoint1 = int(sampleRate * baselineTimes[0])
+        baselinePoint2 = int(sampleRate * baselineTimes[1])
+        baselines = np.mean(sweeps[:, baselinePoint1:baselinePoint2],
+                            axis=1, keepdims=True)
+        segments = segments - baselines
+    else:
+        segments = np.array(segments, dtype=float)
+
+    if blankPoints is not None:
+        blank1 = max(blankPoints[0] - segmentPoint1, 0)
+        blank2 = max(blankPoints[1] - segmentPoint1, 0)
+        segments[:, blank1:blank2] = np.nan
+
+    return segments
+
+
+@dataclass
+class DsiTriplet:
+    """
+    Holds paths for 3 ABFs composing a DSI set:
+        path1 - baseline
+        path2 - depolarization
+        path3 - recovery
+    """
+    parent: str
+    path1: pathlib.Path
+    path2: pathlib.Path
+    path3: pathlib.Path
+
+
+@dataclass
+class TripletMetrics:
+    """
+    Numerical results for one DSI triplet.
+    Currents are pA, times are seconds from the start of the segment,
+    and resistances are MΩ (from the memtest of the baseline ABF).
+    """
+    parent: str
+    tripletIndex: int
+    abf1: str
+    abf2: str
+    abf3: str
+    baselineMin: float
+    baselineMinTime: float
+    recoveryMin: float
+    recoveryMinTime: float
+    dsiPercent: float
+    raMean: float
+    raStdErr: float
+
+
+@dataclass
+class TripletTraces:
+    """
+    Segments needed to plot a DSI triplet
+    """
+    sampleRate: int
+    baselineMean: np.ndarray
+    recovery: np.ndarray
+
+
+@dataclass
+class ParentMetrics:
+    """
+    Numerical results summarizing every DSI triplet of one cell
+    """
+    parent: str
+    tripletCount: int
+    dsiPercentMean: float
+    dsiPercentStdErr: float
+    raMean: float
+    raFirst: float
+    raLast: float
+
+
+def measureTriplet(triplet: DsiTriplet, tripletIndex: int,
+                   cache: abfCache.AbfDataCache) -> tuple[TripletMetrics, TripletTraces]:
+    """
+    Compare the mean evoked response of every baseline sweep
+    with the response of the first sweep after depolarization.
+    """
+    sampleRate = cache.getAbf(triplet.path1).sampleRate
+    baselineMean = np.mean(getSegments(
+        cache.getSweeps(triplet.path1), sampleRate), axis=0)
+    baselineMinI = np.nanargmin(baselineMean)
+
+    recovery = getSegments(cache.getSweeps(triplet.path3)[0], sampleRate)[0]
+    recoveryMinI = np.nanargmin(recovery)
+
+    resistances = cache.getRa(triplet.path1)
+
+    metrics = TripletMetrics(
+        parent=triplet.parent,
+        tripletIndex=tripletIndex,
+        abf1=pathlib.Path(triplet.path1).stem,
+        abf2=pathlib.Path(triplet.path2).stem,
+        abf3=pathlib.Path(triplet.path3).stem,
+        baselineMin=float(baselineMean[baselineMinI]),
+        baselineMinTime=float(baselineMinI / sampleRate),
+        recoveryMin=float(recovery[recoveryMinI]),
+        recoveryMinTime=float(recoveryMinI / sampleRate),
+        dsiPercent=float(100 * (1 - recovery[recoveryMinI] / baselineMean[baselineMinI])),
+        raMean=float(np.mean(resistances)),
+        raStdErr=float(np.std(resistances) / np.sqrt(len(resistances))))
+
+    traces = TripletTraces(sampleRate, baselineMean, recovery)
+
+    return metrics, traces
+
+
+def summarizeParent(parent: str, tripletMetrics: list[TripletMetrics]) -> ParentMetrics:
+    """
+    Combine the metrics of every triplet from one cell.
+    """
+    dsiPercents = [x.dsiPercent for x in tripletMetrics]
+    ras = [x.raMean for x in tripletMetrics]
+    return ParentMetrics(
+        parent=parent,
+        tripletCount=len(tripletMetrics),
+        dsiPercentMean=float(np.mean(dsiPercents)),
+        dsiPercentStdErr=float(np.std(dsiPercents) / np.sqrt(len(dsiPercents))),
+        raMean=float(np.mean(ras)),
+        raFirst=ras[0],
+        raLast=ras[-1])
+
+
+def metricsToArray(metrics: list) -> np.ndarray:
+    """
+    Convert a list of metrics dataclasses into a NumPy structured array
+    with one column per field.
+    """
+    if len(metrics) == 0:
+        return np.array([])
+    fields = dataclasses.fields(metrics[0])
+    rows = [dataclasses.astuple(x) for x in metrics]
+    dtype = [(field.name, "U64" if field.type is str else field.type)
+             for field in fields]
+    return np.array(rows, dtype=dtype)
+
+
+def saveMetricsCsv(metrics: list, saveAs: pathlib.Path):
+    """
+    Save a list of metrics dataclasses as a CSV file with one column per field.
+    """
+    if len(metrics) == 0:
+        return
+    fieldNames = [x.name for x in dataclasses.fields(metrics[0])]
+    with open(saveAs, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldNames)
+        writer.writeheader()
+        for item in metrics:
+            writer.writerow(dataclasses.asdict(item))
+    print(saveAs)
@@ -0,0 +1,131 @@
+"""
+This file tracks which analysis outputs are up to date.
+
+For each parent the manifest records fingerprints of every input ABF,
+the analysis parameters, and the numerical results. Figures are recorded
+separately (with the inputs and figure parameters they were made from)
+so a run without plotting does not invalidate figures of an earlier run.
+A parent whose inputs and parameters are unchanged does not need to be
+analyzed again, and its stored results can be reused in summary tables.
+"""
+
+import dataclasses
+import hashlib
+import pathlib
+import sys
+import dsiTools
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import atomicFiles  # nopep8
+
+MANIFEST_VERSION = 2
+MANIFEST_FILENAME = "manifest.json"
+
+
+def getFingerprint(path: pathlib.Path, useHash: bool = False) -> dict:
+    """
+    Return a dictionary identifying the current contents of a file.
+    Size and modification time are always included,
+    and a SHA-1 of the contents is included if requested.
+    """
+    path = pathlib.Path(path)
+    stat = path.stat()
+    fingerprint = {"path": str(path), "size": stat.st_size, "mtime": stat.st_mtime}
+    if useHash:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        fingerprint["sha1"] = sha1.hexdigest()
+    return fingerprint
+
+
+def getTripletFingerprints(tripletList: list[dsiTools.DsiTriplet], useHash: bool = False) -> list[dict]:
+    """
+    Return fingerprints for every ABF used by a list of triplets.
+    """
+    fingerprints = []
+    for triplet in tripletList:
+        for path in [triplet.path1, triplet.path2, triplet.path3]:
+            fingerprints.append(getFingerprint(path, useHash))
+    return fingerprints
+
+
+class AnalysisManifest:
+    """
+    Input fingerprints, parameters, outputs, and results for every analyzed parent.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.parents = {}
+        data = atomicFiles.readVersionedJson(path, MANIFEST_VERSION)
+        if data is not None:
+            self.parents = data["parents"]
+
+    def isCurrent(self, parent: str, inputs: list[dict], parameters: dict) -> bool:
+        """
+        Return True if the parent was analyzed with identical inputs and parameters.
+        """
+        entry = self.parents.get(parent)
+        if entry is None:
+            return False
+        return entry["inputs"] == inputs and entry["parameters"] == parameters
+
+    def isFigureCurrent(self, parent: str, inputs: list[dict], figureParameters: dict,
+                        outputs: list[pathlib.Path]) -> bool:
+        """
+        Return True if the parent's figures were made from identical inputs and
+        figure parameters and every requested figure file still exists.
+        """
+        entry = self.parents.get(parent)
+        if entry is None or entry.get("figures") is None:
+            return False
+        figures = entry["figures"]
+        if figures["inputs"] != inputs or figures["parameters"] != figureParameters:
+            return False
+        recordedOutputs = set(figures["outputs"])
+        for output in outputs:
+            if str(output) not in recordedOutputs or not pathlib.Path(output).exists():
+                return False
+        return True
+
+    def record(self, parent: str, inputs: list[dict], parameters: dict,
+               tripletMetrics: list[dsiTools.TripletMetrics],
+               parentMetrics: dsiTools.ParentMetrics):
+        """
+        Store the inputs, parameters, and results of a completed analysis.
+        Previously recorded figures are kept (they are checked against their own inputs).
+        """
+        previous = self.parents.get(parent, {})
+        self.parents[parent] = {
+            "inputs": inputs,
+            "parameters": parameters,
+            "tripletMetrics": [dataclasses.asdict(x) for x in tripletMetrics],
+            "parentMetrics": dataclasses.asdict(parentMetrics),
+            "figures": previous.get("figures"),
+        }
+
+    def recordFigures(self, parent: str, inputs: list[dict], figureParameters: dict,
+                      outputs: list[pathlib.Path]):
+        """
+        Store the inputs and figure parameters used to create a parent's figures.
+        """
+        self.parents[parent]["figures"] = {
+            "inputs": inputs,
+            "parameters": figureParameters,
+            "outputs": [str(x) for x in outputs],
+        }
+
+    def getResults(self, parent: str) -> tuple[list[dsiTools.TripletMetrics], dsiTools.ParentMetrics]:
+        """
+        Return the stored results of a previous analysis.
+        """
+        entry = self.parents[parent]
+        tripletMetrics = [dsiTools.TripletMetrics(**x)
+                          for x in entry["tripletMetrics"]]
+        parentMetrics = dsiTools.ParentMetrics(**entry["parentMetrics"])
+        return tripletMetrics, parentMetrics
+
+    def save(self):
+        atomicFiles.writeJson(
+            self.path, {"version": MANIFEST_VERSION, "parents": self.parents})
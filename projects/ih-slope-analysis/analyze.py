@@ -1,8 +1,16 @@
+import concurrent.futures
+import os
 import pathlib
+import sys
+from dataclasses import dataclass
 import groups
 import slopeTools
 import reports
+import resultStore
 import matplotlib.pyplot as plt
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import plotWorkers  # nopep8
+import abfMirror  # nopep8
 
 # initial filtering to reduce sweep-to-sweep current variation
 INITIAL_FILTER_SIZE = 10
@@ -13,8 +21,99 @@ REGRESSION_SIZE = 17
 # threshold beyond which cells are considered responders
 RESPONDER_SLOPE_THRESHOLD = -1.5
 
+# ABF lists and titles of every report (see groups.csv)
+REPORT_GROUPS = [(group.abfPaths, group.title) for group in groups.GROUPS]
 
-def makeReport(outFolder: pathlib.Path, abfPaths: list[pathlib.Path], title: str):
+# local folder where per-ABF results are cached between runs
+RESULT_STORE_FOLDER = pathlib.Path(__file__).parent.joinpath("output", "results")
+
+# part of every figure key, so cached report figures are redrawn when it changes
+FIGURE_VERSION = 1
+
+
+@dataclass
+class AbfResult:
+    """
+    Slopes from the analysis of one ABF.
+    The full analysis and encoded figure are None if they were not needed.
+    """
+    abfPath: str
+    baselineSlope: float
+    drugSlope: float
+    analysis: slopeTools.SlopeAnalysis = None
+    figure: bytes = None
+
+
+def getFigureKey(abfPath: str) -> str:
+    """
+    Return a key that changes whenever the ABF or analysis parameters change.
+    """
+    stat = os.stat(abfPath)
+    return reports.figureKey(str(abfPath), stat.st_size, stat.st_mtime,
+                             INITIAL_FILTER_SIZE, REGRESSION_SIZE, FIGURE_VERSION,
+                             slopeTools.ANALYSIS_VERSION)
+
+
+def getAnalysis(abfPath: str, store: resultStore.ResultStore = None) -> slopeTools.SlopeAnalysis:
+    """
+    Analyze one ABF using sweep means from the result store
+    (so the ABF is only read if it is new or has changed)
+    and store the resulting slopes.
+    """
+    if store is None:
+        store = resultStore.ResultStore(RESULT_STORE_FOLDER)
+    series = store.getSeries(abfPath)
+    analysis = slopeTools.getSeriesSlopeAnalysis(
+        series.abfID, series.rawTimes, series.rawCurrents,
+        series.sweepPeriod, series.drugTimeStart,
+        INITIAL_FILTER_SIZE, REGRESSION_SIZE)
+    store.setSlopes(abfPath, INITIAL_FILTER_SIZE, REGRESSION_SIZE,
+                    analysis.baselineSlope, analysis.drugSlope)
+    return analysis
+
+
+def analyzeAbf(abfPath: str, makeFigure: bool = True) -> AbfResult:
+    """
+    Analyze one ABF and return its slopes and (optionally) its figure.
+    Stored slopes are returned without analysis if no figure is needed.
+    The figure is returned as encoded bytes so it can be sent back from a
+    worker process cheaply.
+    """
+    store = resultStore.ResultStore(RESULT_STORE_FOLDER)
+
+    slopes = store.getSlopes(abfPath, INITIAL_FILTER_SIZE, REGRESSION_SIZE)
+    if slopes is not None and not makeFigure:
+        return AbfResult(abfPath, slopes[0], slopes[1])
+
+    analysis = getAnalysis(abfPath, store)
+
+    figure = None
+    if makeFigure:
+        fig = slopeTools.plotSlopeAnalysis(analysis)
+        figure = reports.figureToBytes(fig)
+        plt.close(fig)
+
+    return AbfResult(abfPath, analysis.baselineSlope, analysis.drugSlope,
+                     analysis, figure)
+
+
+def renderFigure(result: AbfResult):
+    """
+    Return the figure of an analyzed ABF (already encoded if available).
+    """
+    if result.figure is not None:
+        return result.figure
+    analysis = result.analysis or getAnalysis(result.abfPath)
+    return slopeTools.plotSlopeAnalysis(analysis)
+
+
+def makeReport(outFolder: pathlib.Path, abfPaths: list[pathlib.Path], title: str,
+               results: dict[str, AbfResult] = None):
+    """
+    Analyze every ABF in a group and save the report as a HTML file.
+    If results are given (keyed by ABF path) they are used instead of
+    analyzing the ABFs again.
+    """
     report = reports.ReportPage(outFolder, title)
     report.addTitle(title)
 
@@ -25,24 +124,33 @@ def makeReport(outFolder: pathlib.Path, abfPaths: list[pathlib.Path], title: str
     for abfPath in abfPaths:
         print(abfPath)
 
-        # this step does all the analysis and generates the plot in memory
-        baselineSlope, drugSlope = slopeTools.getBaselineAndMaxDrugSlope(
-            abfPath, INITIAL_FILTER_SIZE, REGRESSION_SIZE, show=False)
+        if results is None:
+            result = analyzeAbf(abfPath, makeFigure=False)
+        else:
+            result = results[abfPath]
+
+        report.addHeading(pathlib.Path(abfPath).name)
+        report.addCode(f"path: {abfPath}")
+
+        if isinstance(result, Exception):
+            report.addCode(f"ERROR: {result}")
+            report.addHr()
+            continue
 
+        baselineSlope = result.baselineSlope
+        drugSlope = result.drugSlope
         baselineSlopes.append(baselineSlope)
         drugSlopes.append(drugSlope)
         abfIDs.append(pathlib.Path(abfPath).name)
 
-        report.addHeading(pathlib.Path(abfPath).name)
-        report.addCode(f"path: {abfPath}")
         report.addCode(f"baseline slope: {baselineSlope}")
         report.addCode(f"drug slope: {drugSlope}")
         deltaSlope = drugSlope - baselineSlope
         responseClass = 'responsive' if deltaSlope < RESPONDER_SLOPE_THRESHOLD else 'unresponsive'
         report.addCode(f"delta slope: {deltaSlope} " +
                        f"<span class='{responseClass}'>{responseClass}</span>")
-        report.addFigure(plt.gcf())
-        plt.close()
+        report.addCachedFigure(getFigureKey(abfPath),
+                               lambda: renderFigure(result))
         report.addHr()
 
     addTable(report, abfIDs, baselineSlopes, drugSlopes)
@@ -50,6 +158,84 @@ def makeReport(outFolder: pathlib.Path, abfPaths: list[pathlib.Path], title: str
     report.save()
 
 
+def _iterateJobs(jobs: dict[str, bool], results: dict, ahead: int = 2):
+    """
+    Yield (abfPath, makeFigure) for every job. Jobs whose sweep means are
+    already stored come first, then the remaining ABFs are yielded once their
+    local copy is ready while the next ones are copied in the background.
+    ABFs that cannot be copied are stored in results as errors.
+    """
+    store = resultStore.ResultStore(RESULT_STORE_FOLDER)
+    toRead = [x for x in jobs if not store.hasSeries(x)]
+    for abfPath in jobs:
+        if abfPath not in toRead:
+            yield abfPath, jobs[abfPath]
+
+    mirror = abfMirror.getMirror()
+    for i, abfPath in enumerate(toRead):
+        mirror.prefetch(toRead[i+1:i+1+ahead])
+        try:
+            mirror.resolve(abfPath)
+        except OSError as ex:
+            print(f"ERROR analyzing {abfPath}: {ex}")
+            results[abfPath] = ex
+            continue
+        yield abfPath, jobs[abfPath]
+
+
+def makeReports(outFolder: pathlib.Path, reportGroups: list[tuple[list[str], str]], workers: int = 1):
+    """
+    Create a report for every (abfPaths, title) group.
+    Every unique ABF across all groups is analyzed once (on a process pool
+    if workers is greater than 1), then reports are assembled in the order
+    they were given. Figures are only rendered for ABFs without a cached figure.
+    ABFs that fail to analyze are noted in the report instead of stopping the run.
+    ABFs that must be read are copied into the mirror (see abfMirror.getMirror)
+    a few files ahead of the analysis.
+    """
+    abfPaths = []
+    for groupAbfPaths, title in reportGroups:
+        for abfPath in groupAbfPaths:
+            if abfPath not in abfPaths:
+                abfPaths.append(abfPath)
+
+    results = {}
+    jobs = {}
+    for abfPath in abfPaths:
+        try:
+            figurePath = reports.getCachedFigurePath(
+                outFolder, getFigureKey(abfPath))
+        except OSError as ex:
+            print(f"ERROR analyzing {abfPath}: {ex}")
+            results[abfPath] = ex
+            continue
+        jobs[abfPath] = not figurePath.exists()
+
+    if workers <= 1:
+        for abfPath, makeFigure in _iterateJobs(jobs, results):
+            try:
+                results[abfPath] = analyzeAbf(abfPath, makeFigure)
+            except Exception as ex:
+                print(f"ERROR analyzing {abfPath}: {ex}")
+                results[abfPath] = ex
+                plt.close("all")
+
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=plotWorkers.initWorker) as executor:
+            futures = {executor.submit(analyzeAbf, abfPath, makeFigure): abfPath
+                       for abfPath, makeFigure in _iterateJobs(jobs, results)}
+            for future in concurrent.futures.as_completed(futures):
+                abfPath = futures[future]
+                try:
+                    results[abfPath] = future.result()
+                except Exception as ex:
+                    print(f"ERROR analyzing {abfPath}: {ex}")
+                    results[abfPath] = ex
+
+    for groupAbfPaths, title in reportGroups:
+        makeReport(outFolder, groupAbfPaths, title, results)
+
+
 def addTable(report: reports.ReportPage, abfIDs, baselineSlopes, drugSlopes):
 
     report.addHeading("Table")
@@ -76,13 +262,4 @@ def addTable(report: reports.ReportPage, abfIDs, baselineSlopes, drugSlopes):
 
 if __name__ == "__main__":
     outFolder = pathlib.Path(__file__).parent.joinpath("output")
-
-    makeReport(outFolder, groups.tgot10nm, "TGOT (10 nM)")
-    makeReport(outFolder, groups.tgot10nm_L368, "TGOT (10 nM) +L368")
-    makeReport(outFolder, groups.tgot10nm_NAc, "TGOT (10 nM) to NAc")
-
-    makeReport(outFolder, groups.tgot50nm, "TGOT (50 nM) all")
-    makeReport(outFolder, groups.tgot50nm_L368, "TGOT (50 nM) +L368")
-
-    makeReport(outFolder, groups.opto, "Opto")
-    makeReport(outFolder, groups.opto_L368, "Opto +L368")
+    makeReports(outFolder, REPORT_GROUPS, workers=os.cpu_count())
@@ -1,110 +1,49 @@
-opto = [
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21124006.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21124013.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21124020.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21124026.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21124033.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21126007.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21126016.abf",  # not in rave
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21126030.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21126050.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21126056.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21218033.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21219006.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21218083.abf",  # found in rave
-]
+"""
+Groups of ABFs to compare are defined in groups.csv (one row per ABF).
+Rows are listed in report order, and rows starting with # are ignored.
 
-opto_L368 = [
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21218077.abf",  # not in rave
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21219013.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21219039.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21219069.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21323006.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21323036.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21323047.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21325007.abf",
-    "X:/Data/C57/TGOT on PVT/2020-10-12 OT-ChR2/21325019.abf",
-]
+Groups are available as a list (GROUPS) or by name (e.g., groups.tgot10nm).
+"""
 
-tgot10nm = [
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20804007.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20804030.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20804043.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20804048.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20804060.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20804066.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20805008.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20805029.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20805035.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20811011.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20811021.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20817012.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20831011.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20831017.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/2021_05_14_DIC1_0008.abf",
-]
+import csv
+import pathlib
+from dataclasses import dataclass
 
-tgot10nm_NAc = [
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20n19022.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20n19029.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20n19036.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20n19052.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d03006.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d03032.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d03055.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d04012.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d04023.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d04030.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d04038.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d04045.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d04052.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d16012.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d16020.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d16035.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d17022.abf",
-    "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20d17028.abf",
-    # "X:/Data/C57/TGOT on PVT/2020-11-18 TGOT on PVT-NAc neurons/20n19038.abf",  # found in rave
-]
+REGISTRY_PATH = pathlib.Path(__file__).parent.joinpath("groups.csv")
 
-tgot10nm_L368 = [
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20805041.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20805047.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20805053.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20806018.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20806036.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20811034.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20811041.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20817020.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20817026.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20817032.abf",  # not in rave
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20817039.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20901022.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20901035.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-28 10nM TGOT on PVT/20902011.abf",
-]
 
-tgot50nm = [
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20723038.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20723029.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20724011.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20724017.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20724023.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20724027.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20724033.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/20724045.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/2021_05_13_DIC1_0005.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/2021_05_13_DIC1_0021.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/2021_05_13_DIC1_0025.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-23 50nM TGOT on PVT/2021_05_13_DIC3_0050.abf",
-]
+@dataclass
+class AbfGroup:
+    """
+    A named list of ABFs analyzed together in one report
+    """
+    name: str
+    title: str
+    abfPaths: list[str]
 
-tgot50nm_L368 = [
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/20727010.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/20727026.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/20727032.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/20727039.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/20728005.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/20728011.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/20728026.abf",
-    "X:/Data/C57/TGOT on PVT/2020-07-27 50nM TGOT w L368/2021_05_13_DIC3_0043.abf",
-]
+
+def loadGroups(csvPath: pathlib.Path = REGISTRY_PATH) -> list[AbfGroup]:
+    """
+    Return every group in the registry in the order they first appear.
+    """
+    lines = csvPath.read_text().splitlines()
+    lines = [x for x in lines if x.strip() and not x.lstrip().startswith("#")]
+
+    groupsByName = {}
+    for row in csv.DictReader(lines):
+        name = row["group"]
+        if name not in groupsByName:
+            groupsByName[name] = AbfGroup(name, row["title"], [])
+        groupsByName[name].abfPaths.append(row["path"])
+
+    return list(groupsByName.values())
+
+
+GROUPS = loadGroups()
+
+
+def __getattr__(name: str) -> list[str]:
+    for group in GROUPS:
+        if group.name == name:
+            return group.abfPaths
+    raise AttributeError(f"no group named {name} in {REGISTRY_PATH.name}")
@@ -0,0 +1,133 @@
+"""
+This script evaluates how robust the holding current slope analysis is
+to its filter size, regression size, and responder threshold.
+
+Sweep means are loaded once per ABF (from the result store when possible),
+then every parameter combination is evaluated from the cached series
+and saved as a tidy CSV table. Combinations that cannot be analyzed have
+NaN slopes and an empty responder column.
+"""
+
+import csv
+import pathlib
+import numpy as np
+import scipy.stats
+import analyze
+import resultStore
+import slopeTools
+
+
+def getSlopeGrid(series: slopeTools.HoldingCurrentSeries, filterSizes: list[int],
+                 regressionSizes: list[int]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return baseline and drug slopes of one ABF for every parameter combination
+    as two (filterSizes x regressionSizes) arrays, giving the same values as
+    getSeriesSlopeAnalysis. Currents are smoothed (and the baseline fitted) once
+    per filter size and rolling slopes are calculated once per regression size.
+    Combinations that cannot be analyzed are NaN.
+    """
+    baselineSlopes = np.full((len(filterSizes), len(regressionSizes)), np.nan)
+    drugSlopes = np.full((len(filterSizes), len(regressionSizes)), np.nan)
+    drugTimeStart = series.drugTimeStart
+    drugTimeEnd = drugTimeStart + 5
+
+    for i, filterSize in enumerate(filterSizes):
+        smoothCurrents, smoothTimes = slopeTools.smoothY(
+            [series.rawCurrents, series.rawTimes], filterSize)
+        try:
+            baselineIndexStart, baselineIndexEnd = slopeTools.rangeIndex(
+                smoothTimes, drugTimeStart - 4, drugTimeStart)
+            baselineSlope = scipy.stats.linregress(
+                smoothTimes[baselineIndexStart:baselineIndexEnd],
+                smoothCurrents[baselineIndexStart:baselineIndexEnd]).slope
+        except ValueError:
+            continue
+
+        for j, regressionSize in enumerate(regressionSizes):
+            try:
+                segSlopes = slopeTools.getRollingSlopes(
+                    smoothCurrents, regressionSize, series.sweepPeriod)
+                segTimes = np.arange(len(segSlopes)) * series.sweepPeriod + \
+                    regressionSize * series.sweepPeriod
+                drugIndex = slopeTools.rangeArgMin(
+                    segSlopes, segTimes, drugTimeStart, drugTimeEnd)
+            except ValueError:
+                continue
+            baselineSlopes[i, j] = baselineSlope
+            drugSlopes[i, j] = segSlopes[drugIndex]
+
+    return baselineSlopes, drugSlopes
+
+
+def sweepParameters(seriesByGroup: dict[str, list[slopeTools.HoldingCurrentSeries]],
+                    filterSizes: list[int], regressionSizes: list[int],
+                    thresholds: list[float]) -> list[dict]:
+    """
+    Return one row for every group, ABF, and parameter combination.
+    Each ABF is analyzed once (even if it is in several groups).
+    Combinations that cannot be analyzed (e.g., a window larger than the recording)
+    produce NaN slopes and an empty responder value.
+    """
+    filterSizes = list(filterSizes)
+    regressionSizes = list(regressionSizes)
+    thresholds = [float(x) for x in thresholds]
+
+    slopesByPath = {}
+    for seriesList in seriesByGroup.values():
+        for series in seriesList:
+            if series.abfPath not in slopesByPath:
+                slopesByPath[series.abfPath] = getSlopeGrid(
+                    series, filterSizes, regressionSizes)
+
+    rows = []
+    for group, seriesList in seriesByGroup.items():
+        for series in seriesList:
+            baselineSlopes, drugSlopes = slopesByPath[series.abfPath]
+            deltaSlopes = drugSlopes - baselineSlopes
+            for i, filterSize in enumerate(filterSizes):
+                for j, regressionSize in enumerate(regressionSizes):
+                    deltaSlope = float(deltaSlopes[i, j])
+                    for threshold in thresholds:
+                        rows.append({
+                            "group": group,
+                            "abfID": series.abfID,
+                            "filterSize": filterSize,
+                            "regressionSize": regressionSize,
+                            "threshold": threshold,
+                            "baselineSlope": float(baselineSlopes[i, j]),
+                            "drugSlope": float(drugSlopes[i, j]),
+                            "deltaSlope": deltaSlope,
+                            "responder": None if np.isnan(deltaSlope) else deltaSlope < threshold,
+                        })
+    return rows
+
+
+def saveRows(rows: list[dict], saveAs: pathlib.Path):
+    with open(saveAs, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(saveAs)
+
+
+if __name__ == "__main__":
+    outFolder = pathlib.Path(__file__).parent.joinpath("output")
+    if not outFolder.exists():
+        outFolder.mkdir()
+
+    store = resultStore.ResultStore(analyze.RESULT_STORE_FOLDER)
+    seriesByPath = {}
+    seriesByGroup = {}
+    for abfPaths, title in analyze.REPORT_GROUPS:
+        for abfPath in abfPaths:
+            if abfPath not in seriesByPath:
+                print(abfPath)
+                seriesByPath[abfPath] = store.getSeries(abfPath)
+        seriesByGroup[title] = [seriesByPath[x] for x in abfPaths]
+
+    rows = sweepParameters(seriesByGroup,
+                           filterSizes=range(4, 24, 2),
+                           regressionSizes=range(8, 28, 2),
+                           thresholds=[-0.5, -1, -1.5, -2, -2.5])
+
+    saveRows(rows, outFolder.joinpath("parameterSweep.csv"))
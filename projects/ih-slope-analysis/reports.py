@@ -1,28 +1,117 @@
 import matplotlib.pyplot as plt
 import matplotlib.figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import pathlib
+import io
+import base64
+import collections
+import concurrent.futures
+import hashlib
+import json
+import sys
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import atomicFiles  # nopep8
+
+IMAGE_MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def figureToBytes(fig: matplotlib.figure.Figure, format: str = "png",
+                  compressLevel: int = None) -> bytes:
+    """encode a figure as an image file in memory"""
+    buffer = io.BytesIO()
+    if format == "png" and compressLevel is not None:
+        fig.savefig(buffer, format=format,
+                    pil_kwargs={"compress_level": compressLevel})
+    else:
+        fig.savefig(buffer, format=format)
+    return buffer.getvalue()
+
+
+def figureKey(*inputs) -> str:
+    """
+    Return a short hash identifying a figure by everything used to make it
+    (e.g., input file path, size, modification time, and analysis parameters).
+    Inputs must be JSON-serializable.
+    """
+    text = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def getCachedFigurePath(outFolder: pathlib.Path, key: str, imageFormat: str = "png") -> pathlib.Path:
+    """return the path where a figure with the given key is stored"""
+    return outFolder.joinpath("images", f"fig_{key}.{imageFormat}")
 
 
 class ReportPage:
     """
-    This class builds a report that can be saved as a HTML file.
+    This class builds a report that is streamed to a HTML file.
+
+    HTML is written to disk as soon as it is added. Figures are encoded on
+    background threads and their HTML is written in order once encoding
+    finishes, so analysis continues while earlier figures are encoded.
+    Figures must not be modified after they are added. Added figures are
+    closed in pyplot and given their own Agg canvas before they are handed
+    to a thread, so encoding only supports Agg figures (PNG or SVG output)
+    and never uses the interactive backend.
+
+    Image options:
+        imageFormat: png or svg
+        compressLevel: PNG compression level (0-9, None for the default)
+        inline: embed images in the HTML as base64 instead of saving image files
     """
 
-    def __init__(self, outFolder: pathlib.Path, title: str):
+    def __init__(self, outFolder: pathlib.Path, title: str,
+                 imageFormat: str = "png", compressLevel: int = None,
+                 inline: bool = False, encodeThreads: int = 2):
+        if imageFormat not in IMAGE_MIME_TYPES:
+            raise ValueError(f"unsupported image format: {imageFormat}")
+
         self.title = title
         self.titleSafe = self._safeName(title)
         self.imageCount = 0
-        self.body = []
+        self.imageFormat = imageFormat
+        self.compressLevel = compressLevel
+        self.inline = inline
 
         self.outFolder = outFolder
         self.imageFolder = self.outFolder.joinpath("images")
         self._makeFolders([self.outFolder, self.imageFolder])
 
+        self._pending = collections.deque()
+        self._encoder = concurrent.futures.ThreadPoolExecutor(encodeThreads)
+        self.filePath = self.outFolder.joinpath(self.titleSafe+".html")
+        self._file = open(self.filePath, 'w')
+        self._file.write("<html>")
+        self._file.write("<head>")
+        self._file.write("<link rel='stylesheet' href='../style.css'>")
+        self._file.write("</head>\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    def _append(self, html):
+        """queue HTML (or a future that returns HTML) and write everything that is ready"""
+        self._pending.append(html)
+        self._flush()
+
+    def _flush(self, wait: bool = False):
+        while self._pending:
+            item = self._pending[0]
+            if isinstance(item, concurrent.futures.Future):
+                if not (wait or item.done()):
+                    break
+                item = item.result()
+            self._file.write(item + "\n")
+            self._pending.popleft()
+
     def addHtml(self, html: str):
-        self.body.append(html)
+        self._append(html)
 
     def addHr(self):
-        self.body.append("<hr>")
+        self._append("<hr>")
 
     def _makeFolders(self, folders: list[pathlib.Path]):
         for folder in folders:
@@ -30,22 +119,81 @@ class ReportPage:
                 folder.mkdir()
 
     def addCode(self, code: str):
-        self.body.append(f"<div><code>{code}</code></div>")
+        self._append(f"<div><code>{code}</code></div>")
 
     def addHeading(self, text: str):
-        self.body.append(f"<h1>{text}</h1>")
+        self._append(f"<h1>{text}</h1>")
 
     def addTitle(self, text: str):
-        self.body.append(
+        self._append(
             f"<h1 style='text-align: center; font-size: 300%;'>{text}</h1><hr>")
 
+    def _imageHtml(self, imageBytes: bytes, saveFileName: str, extension: str) -> str:
+        """save the image (unless inline) and return the HTML that displays it"""
+        if self.inline:
+            mimeType = IMAGE_MIME_TYPES[extension]
+            encoded = base64.b64encode(imageBytes).decode("ascii")
+            return f"<div><img src='data:{mimeType};base64,{encoded}'></div>"
+        self.imageFolder.joinpath(saveFileName).write_bytes(imageBytes)
+        return f"<div><img src='{self.imageFolder.name}/{saveFileName}'></div>"
+
+    def _encodeFigure(self, fig: matplotlib.figure.Figure, saveFileName: str) -> str:
+        imageBytes = figureToBytes(fig, self.imageFormat, self.compressLevel)
+        return self._imageHtml(imageBytes, saveFileName, self.imageFormat)
+
+    def _detachFigure(self, fig: matplotlib.figure.Figure):
+        """
+        Remove a figure from pyplot and give it a private Agg canvas
+        so it can be encoded on another thread without touching the GUI.
+        """
+        plt.close(fig)
+        FigureCanvasAgg(fig)
+
     def addFigure(self, fig: matplotlib.figure.Figure):
+        self._detachFigure(fig)
+        self.imageCount += 1
+        saveFileName = f"{self.titleSafe}_{self.imageCount}.{self.imageFormat}"
+        self._append(self._encoder.submit(self._encodeFigure, fig, saveFileName))
+
+    def _encodeCachedFigure(self, rendered, saveFilePath: pathlib.Path) -> str:
+        if rendered is None:
+            imageBytes = saveFilePath.read_bytes() if self.inline else None
+        else:
+            if isinstance(rendered, bytes):
+                imageBytes = rendered
+            else:
+                imageBytes = figureToBytes(
+                    rendered, self.imageFormat, self.compressLevel)
+            atomicFiles.writeBytes(saveFilePath, imageBytes)
+        if self.inline:
+            return self._imageHtml(imageBytes, saveFilePath.name, self.imageFormat)
+        return f"<div><img src='{self.imageFolder.name}/{saveFilePath.name}'></div>"
+
+    def hasCachedFigure(self, key: str) -> bool:
+        return getCachedFigurePath(self.outFolder, key, self.imageFormat).exists()
+
+    def addCachedFigure(self, key: str, render):
+        """
+        Add a figure stored by a key describing its inputs (see figureKey).
+        If a figure with this key was saved previously it is reused and
+        render is never called. Otherwise render is called and must return
+        a figure or already-encoded image bytes. Rendered figures are closed,
+        given an Agg canvas, and encoded in the background.
+        """
+        saveFilePath = getCachedFigurePath(
+            self.outFolder, key, self.imageFormat)
+        rendered = None if saveFilePath.exists() else render()
+        if isinstance(rendered, matplotlib.figure.Figure):
+            self._detachFigure(rendered)
+        self._append(self._encoder.submit(
+            self._encodeCachedFigure, rendered, saveFilePath))
+
+    def addImage(self, imageBytes: bytes, extension: str = "png"):
+        """add an image that was already encoded (e.g., by another process)"""
         self.imageCount += 1
-        saveFileName = f"{self.titleSafe}_{self.imageCount}.png"
-        saveFilePath = self.imageFolder.joinpath(saveFileName)
-        fig.savefig(saveFilePath)
-        self.body.append(
-            f"<div><img src='{self.imageFolder.name}/{saveFileName}'></div>")
+        saveFileName = f"{self.titleSafe}_{self.imageCount}.{extension}"
+        self._append(self._encoder.submit(
+            self._imageHtml, imageBytes, saveFileName, extension))
 
     def _safeName(self, name: str) -> str:
         """convert a string into a filename-safe string"""
@@ -64,11 +212,10 @@ class ReportPage:
         return name
 
     def save(self):
-        filePath = self.outFolder.joinpath(self.titleSafe+".html")
-        with open(filePath, 'w') as f:
-            f.write("<html>")
-            f.write("<head>")
-            f.write("<link rel='stylesheet' href='../style.css'>")
-            f.write("</head>")
-            f.write("\n".join(self.body))
-            f.write("</html>")
+        """wait for all figures to be encoded and finish the HTML file"""
+        if self._file.closed:
+            return
+        self._flush(wait=True)
+        self._encoder.shutdown()
+        self._file.write("</html>")
+        self._file.close()
@@ -0,0 +1,107 @@
+"""
+This file contains a local store of per-ABF analysis results.
+
+Sweep means and slope results are saved in a local folder keyed by ABF path
+and are reused as long as the ABF's size and modification time (and the
+analysis version) are unchanged.
+This avoids re-reading ABFs from the network share when the same file
+appears in several groups or is analyzed again in a later run.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import numpy as np
+import slopeTools
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import atomicFiles  # nopep8
+
+
+class ResultStore:
+    """
+    Cached holding current series and slope results for every ABF.
+    Each ABF has its own files so separate processes can share a store.
+    """
+
+    def __init__(self, folder: pathlib.Path):
+        self.folder = folder
+        if not self.folder.exists():
+            self.folder.mkdir(parents=True)
+
+    def _basePath(self, abfPath: str) -> pathlib.Path:
+        key = hashlib.sha1(str(abfPath).encode()).hexdigest()[:16]
+        return self.folder.joinpath(f"{pathlib.Path(abfPath).stem}_{key}")
+
+    def _fingerprint(self, abfPath: str) -> list:
+        stat = os.stat(abfPath)
+        return [stat.st_size, stat.st_mtime, slopeTools.ANALYSIS_VERSION]
+
+    def hasSeries(self, abfPath: str) -> bool:
+        """
+        Return True if the series of an ABF is stored and current
+        (so getSeries will not need to read the ABF).
+        """
+        seriesPath = self._basePath(abfPath).with_suffix(".npz")
+        if not seriesPath.exists():
+            return False
+        with np.load(seriesPath) as stored:
+            return list(stored["fingerprint"]) == self._fingerprint(abfPath)
+
+    def getSeries(self, abfPath: str) -> slopeTools.HoldingCurrentSeries:
+        """
+        Return the holding current series of an ABF, reading the ABF only
+        if it is not stored or has changed since it was stored.
+        """
+        fingerprint = self._fingerprint(abfPath)
+        seriesPath = self._basePath(abfPath).with_suffix(".npz")
+
+        if seriesPath.exists():
+            with np.load(seriesPath) as stored:
+                if list(stored["fingerprint"]) == fingerprint:
+                    return slopeTools.HoldingCurrentSeries(
+                        abfPath=str(abfPath),
+                        abfID=str(stored["abfID"]),
+                        rawTimes=stored["rawTimes"],
+                        rawCurrents=stored["rawCurrents"],
+                        sweepPeriod=float(stored["sweepPeriod"]),
+                        drugTimeStart=float(stored["drugTimeStart"]))
+
+        series = slopeTools.getHoldingCurrentSeries(abfPath)
+        atomicFiles.writeAtomic(seriesPath, lambda f: np.savez(
+            f,
+            fingerprint=np.array(fingerprint),
+            abfID=series.abfID,
+            rawTimes=series.rawTimes,
+            rawCurrents=series.rawCurrents,
+            sweepPeriod=series.sweepPeriod,
+            drugTimeStart=series.drugTimeStart))
+        return series
+
+    def _loadSlopes(self, abfPath: str) -> dict:
+        slopesPath = self._basePath(abfPath).with_suffix(".json")
+        if slopesPath.exists():
+            stored = json.loads(slopesPath.read_text())
+            if stored["fingerprint"] == self._fingerprint(abfPath):
+                return stored
+        return {"fingerprint": self._fingerprint(abfPath), "slopes": {}}
+
+    def getSlopes(self, abfPath: str, filterSize: int, regressionSize: int) -> tuple[float, float]:
+        """
+        Return the stored (baseline slope, drug slope) for these parameters or None.
+        """
+        slopes = self._loadSlopes(abfPath)["slopes"].get(
+            f"{filterSize},{regressionSize}")
+        return None if slopes is None else tuple(slopes)
+
+    def setSlopes(self, abfPath: str, filterSize: int, regressionSize: int,
+                  baselineSlope: float, drugSlope: float):
+        """
+        Store the baseline and drug slopes calculated with these parameters.
+        """
+        stored = self._loadSlopes(abfPath)
+        stored["slopes"][f"{filterSize},{regressionSize}"] = [
+            float(baselineSlope), float(drugSlope)]
+        slopesPath = self._basePath(abfPath).with_suffix(".json")
+        atomicFiles.writeJson(slopesPath, stored)
@@ -6,14 +6,28 @@ current slopes using linear regressions over moving windows.
 import matplotlib.pyplot as plt
 import scipy.stats
 import numpy as np
+import pathlib
 import pyabf
+import sys
+from dataclasses import dataclass
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import abfMirror  # nopep8
+from abfSweeps import getSweepMatrix  # nopep8
+
+# saved with every series and slope in the result store (see resultStore.py)
+# so results from another version of this file are calculated again
+ANALYSIS_VERSION = 1
 
 
 def getFirstTagTime(abfFilePath):
     """
     Return the time (in minutes) of the first tag in an ABF file
+    (or in an ABF that is already loaded)
     """
-    abf = pyabf.ABF(abfFilePath, False)
+    if isinstance(abfFilePath, pyabf.ABF):
+        abf = abfFilePath
+    else:
+        abf = pyabf.ABF(abfFilePath, False)
     if (len(abf.tagTimesMin) > 0):
         return abf.tagTimesMin[0]
     else:
@@ -21,193 +35,424 @@ def getFirstTagTime(abfFilePath):
             "cannot get the first tag time because this ABF does not have any tags")
 
 
-def getMeanBySweep(abf, markerTime1, markerTime2):
+def getWindowStatsBySweep(abf, windows, stat="mean", channel=0):
     """
-    Return the mean value between the markers for every sweep.
+    Return a statistic of the data between each pair of marker times
+    (seconds) for every sweep as a (windows x sweeps) array.
+    All sweeps are evaluated at once from a single view of the ABF's data.
+
+    Supported statistics: mean, median, std
     """
-    assert isinstance(abf, pyabf.ABF)
+    statFunctions = {"mean": np.mean, "median": np.median, "std": np.std}
+    if stat not in statFunctions:
+        raise ValueError(f"unsupported statistic: {stat}")
+    statFunction = statFunctions[stat]
 
+    sweeps = getSweepMatrix(abf, channel)
     pointsPerSecond = abf.dataRate
-    sweepIndex1 = pointsPerSecond * markerTime1
-    sweepIndex2 = pointsPerSecond * markerTime2
+    values = np.empty((len(windows), abf.sweepCount))
+    for i, (markerTime1, markerTime2) in enumerate(windows):
+        index1 = int(pointsPerSecond * markerTime1)
+        index2 = int(pointsPerSecond * markerTime2)
+        values[i] = statFunction(sweeps[:, index1:index2], axis=1)
+    return values
 
-    means = []
-    for i in range(abf.sweepCount):
-        abf.setSweep(i)
-        segment = abf.sweepY[sweepIndex1:sweepIndex2]
-        segmentMean = np.mean(segment)
-        means.append(segmentMean)
 
-    return means
+def getMeanBySweep(abf, markerTime1, markerTime2):
+    """
+    Return the mean value between the markers for every sweep.
+    """
+    return getWindowStatsBySweep(abf, [(markerTime1, markerTime2)])[0]
 
 
-def smoothY(ys, windowSize):
+def smoothY(ys, windowSize, cumulative=False):
     """
     Get smoothed ys and xs by averaging every n=windowSize sweeps/indexes.
+
+    Each output point is the mean of windowSize+1 consecutive values, and the
+    final full window is not included. If ys is 2D every row is smoothed.
+    Windows are averaged in a single vectorized operation that gives results
+    identical to averaging each window individually.
+
+    If cumulative is True means come from movingAverage instead, which is O(n)
+    regardless of window size but may differ from the exact means in their
+    last few digits (about 1e-13 relative error).
+    """
+    if cumulative:
+        return movingAverage(ys, windowSize+1)[..., :-1]
+    ys = np.asarray(ys, dtype=float)
+    if ys.shape[-1] - windowSize - 1 < 1:
+        return np.empty(ys.shape[:-1] + (0,))
+    windows = np.lib.stride_tricks.sliding_window_view(ys, windowSize+1, axis=-1)
+    return np.mean(windows[..., :-1, :], axis=-1)
+
+
+def movingAverage(ys, windowSize, mode="valid", ignoreNan=False):
     """
-    smoothYs = []
-    for i in range(len(ys)-1):
-        start = i
-        end = i+windowSize+1
-        if end > len(ys)-1:
-            break
-        else:
-            smoothY = np.mean(ys[start:end])
-            smoothYs.append(smoothY)
+    Return the moving average of ys using windows of windowSize points.
+    Cumulative sums are used so the cost is O(n) regardless of window size.
+    If ys is 2D every row is averaged independently.
 
-    return smoothYs
+    Modes:
+        valid - only full windows are returned (length n-windowSize+1)
+        trailing - each point is the mean of itself and the preceding points
+        centered - each point is the mean of the points surrounding it
+
+    For trailing and centered modes the output has the same length as the
+    input and points without a full window are NaN.
+
+    If ignoreNan is True NaN values are excluded from each window's mean,
+    otherwise any window containing a NaN produces NaN.
+    """
+    if windowSize < 1:
+        raise ValueError("window size must be at least 1")
+
+    ys = np.array(ys, dtype=float, ndmin=1)
+    validCount = ys.shape[-1] - windowSize + 1
+
+    # subtract each row's mean to improve precision of the cumulative sums
+    isNan = np.isnan(ys)
+    if isNan.all():
+        offset = np.zeros(ys.shape[:-1] + (1,))
+    else:
+        offset = np.nan_to_num(np.nanmean(ys, axis=-1, keepdims=True))
+    values = np.where(isNan, 0, ys - offset)
+
+    def windowSums(x):
+        sums = np.cumsum(x, axis=-1)
+        sums = np.concatenate([np.zeros(sums.shape[:-1] + (1,)), sums], axis=-1)
+        return sums[..., windowSize:] - sums[..., :validCount]
+
+    if validCount < 1:
+        means = np.empty(ys.shape[:-1] + (0,))
+    else:
+        nanCounts = windowSums(isNan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if ignoreNan:
+                means = windowSums(values) / (windowSize - nanCounts)
+            else:
+                means = windowSums(values) / windowSize
+                means[nanCounts > 0] = np.nan
+        means += offset
+
+    if mode == "valid":
+        return means
+    elif mode == "trailing":
+        firstIndex = windowSize - 1
+    elif mode == "centered":
+        firstIndex = (windowSize - 1) // 2
+    else:
+        raise ValueError(f"unknown mode: {mode}")
+
+    output = np.full(ys.shape, np.nan)
+    output[..., firstIndex:firstIndex+means.shape[-1]] = means
+    return output
+
+
+def rangeIndexes(xs, rangeXStarts, rangeXEnds):
+    """
+    Return arrays of start and end indexes for many ranges of a sorted xs at once.
+    Each start index is the last point <= its rangeXStart and each end index is
+    one past the last point <= its rangeXEnd (suitable for slicing).
+    Every lookup is a binary search so cost is O(log n) per range.
+    """
+    xs = np.asarray(xs)
+    rangeStartIndexes = np.searchsorted(xs, rangeXStarts, side='right') - 1
+    rangeEndIndexes = np.searchsorted(xs, rangeXEnds, side='right')
+    if np.any(rangeStartIndexes < 0):
+        raise ValueError("range starts before the first point")
+    if np.any(rangeEndIndexes <= rangeStartIndexes + 1):
+        raise ValueError("range does not contain any points")
+    return rangeStartIndexes, rangeEndIndexes
 
 
 def rangeIndex(xs, rangeXStart, rangeXEnd):
     """
-    Output the indexes of the rangeXStart (the first point that >= rangeXStart) and the rangeXEnd (the last point that <= rangeXStart).
+    Output the indexes of the rangeXStart (the last point that <= rangeXStart) and the rangeXEnd (one past the last point that <= rangeXEnd).
     """
+    rangeStartIndexes, rangeEndIndexes = rangeIndexes(
+        xs, [rangeXStart], [rangeXEnd])
+    return int(rangeStartIndexes[0]), int(rangeEndIndexes[0])
 
-    for i in range(len(xs)):
-        if xs[i] <= rangeXStart:
-            rangeStartIndex = i
-        elif xs[i] > rangeXStart and xs[i] <= rangeXEnd:
-            i = i+1
-            rangeEndIndex = i
-        else:
-            break
 
-    return rangeStartIndex, rangeEndIndex
+def _rangeWindows(ys, startIndexes, endIndexes, fill):
+    """
+    Return the ys of every range as one row of a 2D array.
+    Rows are as long as the longest range and shorter ranges are padded with fill.
+    """
+    ys = np.asarray(ys, dtype=float)
+    lengths = endIndexes - startIndexes
+    width = int(np.max(lengths))
+    padded = np.concatenate([ys, np.full(width, fill)])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width)[startIndexes]
+    return np.where(np.arange(width) < lengths[:, np.newaxis], windows, fill)
 
 
-def getMovingWindowSegments(data, windowSize):
+def rangeArgMins(ys, xs, rangeStarts, rangeEnds):
     """
-    Given a 1D list of data, slide a window along to create individual segments
-    and return a list of lists (each of length windowSize)
+    Return the index of the minimum ys within each range of the sorted xs.
+    All ranges are searched at once as rows of a padded 2D array.
     """
-    segmentCount = len(data) - windowSize
-    segments = [None] * segmentCount
-    for i in range(segmentCount):
-        segments[i] = data[i:i+windowSize]
-    return segments
+    startIndexes, endIndexes = rangeIndexes(xs, rangeStarts, rangeEnds)
+    if len(startIndexes) == 0:
+        return np.array([], dtype=int)
+    windows = _rangeWindows(ys, startIndexes, endIndexes, np.inf)
+    return startIndexes + np.argmin(windows, axis=1)
 
 
-def rangeMin(ys, xs, rangeStart, rangeEnd):
+def rangeArgMaxs(ys, xs, rangeStarts, rangeEnds):
     """
-    Calculate the max ys between a given period.
+    Return the index of the maximum ys within each range of the sorted xs.
+    All ranges are searched at once as rows of a padded 2D array.
     """
+    startIndexes, endIndexes = rangeIndexes(xs, rangeStarts, rangeEnds)
+    if len(startIndexes) == 0:
+        return np.array([], dtype=int)
+    windows = _rangeWindows(ys, startIndexes, endIndexes, -np.inf)
+    return startIndexes + np.argmax(windows, axis=1)
 
-    for i in range(len(xs)):
-        if xs[i] < rangeStart or xs[i] == rangeStart:
-            rangeStartIndex = i
-        elif xs[i] > rangeStart and (xs[i] < rangeEnd or xs[i] == rangeEnd):
-            i = i+1
-            rangeEndIndex = i
-        else:
-            break
 
-    rangeMin = np.min(ys[rangeStartIndex:rangeEndIndex])
-    return rangeMin
+def rangeArgMin(ys, xs, rangeStart, rangeEnd):
+    """
+    Return the index of the minimum ys within a range of the sorted xs.
+    """
+    return int(rangeArgMins(ys, xs, [rangeStart], [rangeEnd])[0])
 
 
-def getSingleSegmentSlope(segment, samplePeriod):
+def rangeArgMax(ys, xs, rangeStart, rangeEnd):
     """
-    Return the slope of a linear line fitted to a single segment.
-    Sample period must be in minutes, and returned slope will be pA/min.
+    Return the index of the maximum ys within a range of the sorted xs.
     """
-    xs = np.arange(len(segment)) * samplePeriod
-    slope, intercept, r, p, stdErr = scipy.stats.linregress(xs, segment)
-    return slope
+    return int(rangeArgMaxs(ys, xs, [rangeStart], [rangeEnd])[0])
 
 
-def getAllSegmentSlopes(segments, samplePeriod):
+def rangeMin(ys, xs, rangeStart, rangeEnd):
     """
-    Given a list of segments, return a list of slopes (one per segment).
-    Sample period must be in minutes, and returned slopes will be pA/min.
+    Calculate the min ys between a given period.
     """
-    slopes = []
-    for segment in segments:
-        slope = getSingleSegmentSlope(segment, samplePeriod)
-        slopes.append(slope)
-    return slopes
+    return ys[rangeArgMin(ys, xs, rangeStart, rangeEnd)]
 
 
-def getBaselineAndMaxDrugSlope(abfFilePath, filterSize=15, regressionSize=15, show=True):
+def getRollingSlopes(data, windowSize, samplePeriod, stdErr=False, rValue=False):
     """
-    This method analyzes holding current in an ABF and returns baseline slope and drug slope.
+    Return the slope of a linear regression for every window of size windowSize
+    sliding along data (the final full window is not included).
+    Sample period must be in minutes, and returned slopes will be pA/min.
+
+    Slopes of all windows are solved at once using cumulative sums, so the cost
+    is O(n) regardless of window size. If stdErr or rValue are True a tuple is
+    returned containing the slopes followed by the requested values for every
+    window. These statistics are calculated from each window after subtracting
+    its own mean (O(n * windowSize)) because residuals from cumulative sums lose
+    precision when a window varies little compared to the whole series.
+    """
+    ys = np.asarray(data, dtype=float)
+    windowCount = len(ys) - windowSize
+    if windowCount < 1:
+        raise ValueError("data must be longer than the window size")
+    if (stdErr or rValue) and windowSize < 3:
+        raise ValueError("window size must be at least 3 to calculate stdErr or rValue")
+
+    # center the data to improve precision of the cumulative sums
+    ys = ys - np.mean(ys)
+    ks = np.arange(len(ys))
+
+    def windowSums(values):
+        sums = np.concatenate([[0], np.cumsum(values)])
+        return sums[windowSize:windowSize+windowCount] - sums[:windowCount]
+
+    starts = np.arange(windowCount)
+    sumY = windowSums(ys)
+    sumKY = windowSums(ks * ys) - starts * sumY
+
+    # x values are identical for every window (0, 1, 2... windowSize-1)
+    meanK = (windowSize - 1) / 2
+    sumKK = windowSize * (windowSize * windowSize - 1) / 12
+    sumXY = sumKY - meanK * sumY
+
+    slopes = sumXY / sumKK / samplePeriod
+
+    if not (stdErr or rValue):
+        return slopes
+
+    windows = np.lib.stride_tricks.sliding_window_view(ys, windowSize)[:windowCount]
+    centered = windows - np.mean(windows, axis=1, keepdims=True)
+    sumYY = np.sum(centered * centered, axis=1)
+    sumXY = centered @ (np.arange(windowSize) - meanK)
+    slopes = sumXY / sumKK / samplePeriod
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = sumXY / np.sqrt(sumKK * sumYY)
+    rs = np.where(sumYY > 0, rs, 0)
+
+    outputs = [slopes]
+    if stdErr:
+        degreesOfFreedom = windowSize - 2
+        rSquared = np.minimum(rs * rs, 1)
+        stdErrs = np.sqrt((1 - rSquared) * sumYY / sumKK / degreesOfFreedom) / samplePeriod
+        outputs.append(stdErrs)
+    if rValue:
+        outputs.append(rs)
+    return tuple(outputs)
+
+
+@dataclass
+class SlopeAnalysis:
+    """
+    Results of a holding current slope analysis.
+    Times are minutes, currents are pA, and slopes are pA/min.
+    """
+    abfID: str
+    rawTimes: np.ndarray
+    rawCurrents: np.ndarray
+    smoothTimes: np.ndarray
+    smoothCurrents: np.ndarray
+    segTimes: np.ndarray
+    segSlopes: np.ndarray
+    baselineTimeStart: float
+    baselineTimeEnd: float
+    baselineSlope: float
+    baselineIntercept: float
+    drugTimeStart: float
+    drugTimeEnd: float
+    drugSlope: float
+    drugSlopeTime: float
+
+
+def getSeriesSlopeAnalysis(abfID, rawTimes, rawCurrents, sweepPeriod, drugTimeStart,
+                           filterSize=15, regressionSize=15) -> SlopeAnalysis:
+    """
+    Analyze a series of holding currents (one per sweep) without loading or plotting anything.
 
     Arguments:
+        sweepPeriod: time between sweeps (minutes)
+        drugTimeStart: time the drug was applied (minutes)
         filterSize: number of points (sweeps) for the moving window average
         regressionSize: number of points (sweeps) to use to calculate regression slopes during the drug range
-
-    Returns:
-        baseline regression slope (over full range)
-        peak drug regression slope (regression over defined size)
     """
 
-    abf = pyabf.ABF(abfFilePath)
-    sweepPeriod = abf.sweepLengthSec / 60.0  # minutes
-
-    plt.figure(figsize=(8, 6))
-    ax1 = plt.subplot(211)
-    plt.title(abf.abfID)
-    plt.ylabel("Mean Current (pA)")
-
-    rawCurrents = getMeanBySweep(abf, 3, 10)
-    rawTimes = abf.sweepTimesMin
-    plt.plot(rawTimes, rawCurrents, 'ko', alpha=.2,
-             fillstyle='none', label="raw data")
-
-    smoothCurrents = smoothY(rawCurrents, filterSize)
-    smoothTimes = smoothY(rawTimes, filterSize)
-    plt.plot(smoothTimes, smoothCurrents, '-',
-             color="C1", alpha=.5, label="smoothed data")
+    smoothCurrents, smoothTimes = smoothY([rawCurrents, rawTimes], filterSize)
 
     # determine drug region based on first tag time
-    drugTimeStart = getFirstTagTime(abfFilePath)
     drugSearchWidth = 5  # minutes
     drugTimeEnd = drugTimeStart + drugSearchWidth
-    plt.axvspan(drugTimeStart, drugTimeEnd, color='r', alpha=.1, lw=0)
 
     # determine baseline region based on drug time
     baselineTimeStart = drugTimeStart - 4
     baselineTimeEnd = drugTimeStart
     baselineIndexStart, baselineIndexEnd = rangeIndex(
         smoothTimes, baselineTimeStart, baselineTimeEnd)
-    baselineCurrent = smoothCurrents[baselineIndexStart:baselineIndexEnd]
-    plt.axvspan(baselineTimeStart, baselineTimeEnd, color='b', alpha=.1, lw=0)
 
-    # isolate smoothed baseline currents
+    # calculate linear regression of smoothed baseline currents
     baselineCurrents = smoothCurrents[baselineIndexStart:baselineIndexEnd]
     baselineTimes = smoothTimes[baselineIndexStart:baselineIndexEnd]
     baselineSlope, baselineIntercept, r, p, stdErr = scipy.stats.linregress(
         baselineTimes, baselineCurrents)
 
-    # calculate linear regression of baseline region
-    baselineRegressionXs = np.linspace(baselineTimeStart, baselineTimeEnd)
-    baselineRegressionYs = baselineRegressionXs * baselineSlope + baselineIntercept
+    # perform a moving window linear regression on the smoothed currents
+    segSlopes = getRollingSlopes(smoothCurrents, regressionSize, sweepPeriod)
+    segTimesOffset = (regressionSize * sweepPeriod)
+    segTimes = np.arange(len(segSlopes)) * sweepPeriod + segTimesOffset
+
+    # search the drug range for the most negative slope
+    drugSlopeMinIndex = rangeArgMin(
+        segSlopes, segTimes, drugTimeStart, drugTimeEnd)
+
+    return SlopeAnalysis(
+        abfID=abfID,
+        rawTimes=np.asarray(rawTimes),
+        rawCurrents=np.asarray(rawCurrents),
+        smoothTimes=smoothTimes,
+        smoothCurrents=smoothCurrents,
+        segTimes=segTimes,
+        segSlopes=segSlopes,
+        baselineTimeStart=baselineTimeStart,
+        baselineTimeEnd=baselineTimeEnd,
+        baselineSlope=baselineSlope,
+        baselineIntercept=baselineIntercept,
+        drugTimeStart=drugTimeStart,
+        drugTimeEnd=drugTimeEnd,
+        drugSlope=segSlopes[drugSlopeMinIndex],
+        drugSlopeTime=segTimes[drugSlopeMinIndex])
+
+
+@dataclass
+class HoldingCurrentSeries:
+    """
+    Mean holding current of every sweep in an ABF
+    """
+    abfPath: str
+    abfID: str
+    rawTimes: np.ndarray
+    rawCurrents: np.ndarray
+    sweepPeriod: float
+    drugTimeStart: float
+
+
+def getHoldingCurrentSeries(abfFilePath) -> HoldingCurrentSeries:
+    """
+    Read an ABF and return the series needed for slope analysis.
+    """
+    abf = pyabf.ABF(abfMirror.getMirror().resolve(abfFilePath))
+    return HoldingCurrentSeries(
+        abfPath=str(abfFilePath),
+        abfID=abf.abfID,
+        rawTimes=np.array(abf.sweepTimesMin),
+        rawCurrents=getMeanBySweep(abf, 3, 10),
+        sweepPeriod=abf.sweepLengthSec / 60.0,  # minutes
+        drugTimeStart=getFirstTagTime(abf))
+
+
+def getSlopeAnalysis(abfFilePath, filterSize=15, regressionSize=15) -> SlopeAnalysis:
+    """
+    Load an ABF and analyze its holding current without plotting anything.
+    """
+    series = getHoldingCurrentSeries(abfFilePath)
+    return getSeriesSlopeAnalysis(series.abfID, series.rawTimes, series.rawCurrents,
+                                  series.sweepPeriod, series.drugTimeStart,
+                                  filterSize, regressionSize)
+
+
+def plotSlopeAnalysis(result: SlopeAnalysis):
+    """
+    Plot raw and smoothed currents (top) and moving window slopes (bottom)
+    onto a new figure and return it.
+    """
+
+    fig = plt.figure(figsize=(8, 6))
+    ax1 = plt.subplot(211)
+    plt.title(result.abfID)
+    plt.ylabel("Mean Current (pA)")
+
+    plt.plot(result.rawTimes, result.rawCurrents, 'ko', alpha=.2,
+             fillstyle='none', label="raw data")
+
+    plt.plot(result.smoothTimes, result.smoothCurrents, '-',
+             color="C1", alpha=.5, label="smoothed data")
+
+    plt.axvspan(result.drugTimeStart, result.drugTimeEnd,
+                color='r', alpha=.1, lw=0)
+    plt.axvspan(result.baselineTimeStart, result.baselineTimeEnd,
+                color='b', alpha=.1, lw=0)
+
+    baselineRegressionXs = np.linspace(
+        result.baselineTimeStart, result.baselineTimeEnd)
+    baselineRegressionYs = baselineRegressionXs * \
+        result.baselineSlope + result.baselineIntercept
     plt.plot(baselineRegressionXs, baselineRegressionYs,
              color='b', ls='--', label="baseline slope")
     plt.grid(alpha=.5, ls='--')
-    if show:
-        print(f"Baseline slope: {baselineSlope} pA/min")
 
-    # perform a moving window linear regression on the smoothed currents
-    segments = getMovingWindowSegments(smoothCurrents, regressionSize)
-    segSlopes = getAllSegmentSlopes(segments, sweepPeriod)
-    segTimesOffset = (regressionSize * sweepPeriod)
-    segTimes = np.arange(len(segSlopes)) * sweepPeriod + segTimesOffset
     plt.subplot(212, sharex=ax1)
-    plt.axvspan(baselineTimeStart, baselineTimeEnd, color='b', alpha=.1, lw=0)
-    plt.plot(segTimes, segSlopes, 'k.-', lw=.5, ms=2, label="local slope")
+    plt.axvspan(result.baselineTimeStart, result.baselineTimeEnd,
+                color='b', alpha=.1, lw=0)
+    plt.plot(result.segTimes, result.segSlopes, 'k.-',
+             lw=.5, ms=2, label="local slope")
     plt.grid(alpha=.5, ls='--')
 
-    # search the drug range for the most negative slope
-    plt.axvspan(drugTimeStart, drugTimeEnd, color='r', alpha=.1)
-    drugSlopeMin = rangeMin(segSlopes, segTimes, drugTimeStart, drugTimeEnd)
-    drugSlopeMinIndex = segSlopes.index(drugSlopeMin)
-    drugSlopeMinTime = segTimes[drugSlopeMinIndex]
-    if show:
-        print(f"Drug slope: {drugSlopeMin} pA/min")
-
-    plt.axvline(drugSlopeMinTime, color='r', ls='--')
-    plt.axhline(drugSlopeMin, color='r', ls='--', label="peak effect slope")
-    plt.axhline(baselineSlope, color='b', ls='--', label="baseline slope")
+    plt.axvspan(result.drugTimeStart, result.drugTimeEnd, color='r', alpha=.1)
+    plt.axvline(result.drugSlopeTime, color='r', ls='--')
+    plt.axhline(result.drugSlope, color='r', ls='--', label="peak effect slope")
+    plt.axhline(result.baselineSlope, color='b', ls='--', label="baseline slope")
 
     plt.ylabel("Slope (pA/min)")
     plt.xlabel("Time (minutes)")
@@ -216,13 +461,35 @@ def getBaselineAndMaxDrugSlope(abfFilePath, filterSize=15, regressionSize=15, sh
 
     # add some marks to the top plot
     plt.subplot(211)
-    plt.axvline(drugSlopeMinTime, color='r', ls='--', label="peak effect")
+    plt.axvline(result.drugSlopeTime, color='r', ls='--', label="peak effect")
     plt.legend(fontsize=8)
 
+    return fig
+
+
+def getBaselineAndMaxDrugSlope(abfFilePath, filterSize=15, regressionSize=15, show=True):
+    """
+    This method analyzes holding current in an ABF and returns baseline slope and drug slope.
+    The figure is left open as the current figure.
+
+    Arguments:
+        filterSize: number of points (sweeps) for the moving window average
+        regressionSize: number of points (sweeps) to use to calculate regression slopes during the drug range
+
+    Returns:
+        baseline regression slope (over full range)
+        peak drug regression slope (regression over defined size)
+    """
+
+    result = getSlopeAnalysis(abfFilePath, filterSize, regressionSize)
+    plotSlopeAnalysis(result)
+
     if show:
+        print(f"Baseline slope: {result.baselineSlope} pA/min")
+        print(f"Drug slope: {result.drugSlope} pA/min")
         plt.show()
 
-    return baselineSlope, drugSlopeMin
+    return result.baselineSlope, result.drugSlope
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import scipy.stats
+import slopeTools
+
+
+def getSeries(pointCount=200, seed=0):
+    """holding current with a drift, a step, and noise (pA)"""
+    rng = np.random.default_rng(seed)
+    ys = -50 + np.linspace(0, 30, pointCount) + rng.normal(0, 5, pointCount)
+    ys[pointCount//2:] -= 40
+    return ys
+
+
+def smoothYLoop(ys, windowSize):
+    """the original smoothY: one np.mean() per window"""
+    smoothYs = []
+    for i in range(len(ys)-1):
+        end = i+windowSize+1
+        if end > len(ys)-1:
+            break
+        smoothYs.append(np.mean(ys[i:end]))
+    return smoothYs
+
+
+def test_smoothY_is_identical_to_loop():
+    ys = getSeries()
+    for windowSize in [1, 2, 5, 15, 100]:
+        assert np.array_equal(slopeTools.smoothY(ys, windowSize),
+                              smoothYLoop(ys, windowSize))
+
+
+def test_smoothY_cumulative_matches_loop():
+    ys = getSeries()
+    for windowSize in [1, 2, 5, 15, 100]:
+        assert np.allclose(slopeTools.smoothY(ys, windowSize, cumulative=True),
+                           smoothYLoop(ys, windowSize), rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("windowSize", [3, 15, 50])
+def test_rolling_slopes_match_linregress(windowSize):
+    ys = getSeries()
+    samplePeriod = 1 / 6
+    slopes, stdErrs, rs = slopeTools.getRollingSlopes(
+        ys, windowSize, samplePeriod, stdErr=True, rValue=True)
+    assert len(slopes) == len(ys) - windowSize
+    xs = np.arange(windowSize) * samplePeriod
+    for i in range(len(slopes)):
+        result = scipy.stats.linregress(xs, ys[i:i+windowSize])
+        assert slopes[i] == pytest.approx(result.slope, rel=1e-9, abs=1e-9)
+        assert stdErrs[i] == pytest.approx(result.stderr, rel=1e-9, abs=1e-9)
+        assert rs[i] == pytest.approx(result.rvalue, rel=1e-9, abs=1e-9)
+
+
+def test_range_argmins_match_loop():
+    ys = getSeries()
+    ys[[20, 21, 90]] = ys.min()  # ties are resolved to the first index
+    ys[60] = np.nan
+    xs = np.arange(len(ys)) * 10.0
+    rangeStarts = [0, 150, 195, 400, 555, 1000, 1800]
+    rangeEnds = [300, 250, 1000, 900, 620, 1990, 1990]
+    for i, (rangeStart, rangeEnd) in enumerate(zip(rangeStarts, rangeEnds)):
+        start, end = slopeTools.rangeIndex(xs, rangeStart, rangeEnd)
+        assert slopeTools.rangeArgMins(ys, xs, rangeStarts, rangeEnds)[i] == \
+            start + np.argmin(ys[start:end])
+        assert slopeTools.rangeArgMaxs(ys, xs, rangeStarts, rangeEnds)[i] == \
+            start + np.argmax(ys[start:end])
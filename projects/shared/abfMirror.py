@@ -0,0 +1,257 @@
+"""
+This file contains a local read-through mirror for ABFs on a network share.
+
+ABFs are copied into a size-bounded local folder the first time they are used
+and the local copy is returned for as long as the source is unchanged.
+The least recently used copies are deleted when the folder grows too large.
+Upcoming files in a work list can be copied on background threads while
+the current file is being analyzed.
+
+Each mirrored file has a small JSON sidecar describing its source, so several
+processes can safely share one mirror folder.
+
+Scripts get a mirror with getMirror(), which uses the folder in the
+ABF_MIRROR_FOLDER environment variable or passes paths through unchanged
+if it is not set.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import atomicFiles
+
+MIRROR_FOLDER_VARIABLE = "ABF_MIRROR_FOLDER"
+MIRROR_SIZE_VARIABLE = "ABF_MIRROR_MAX_GB"
+
+
+class AbfMirror:
+    """
+    Local copies of remote files with LRU eviction and integrity checks
+    """
+
+    def __init__(self, folder: pathlib.Path, maxBytes: int = 20_000_000_000,
+                 prefetchThreads: int = 2, verify: bool = True):
+        self.folder = pathlib.Path(folder)
+        if not self.folder.exists():
+            self.folder.mkdir(parents=True)
+        self.maxBytes = maxBytes
+        self.verify = verify
+        self._prefetcher = concurrent.futures.ThreadPoolExecutor(prefetchThreads)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._evictLock = threading.Lock()
+        self._recent = collections.deque(maxlen=prefetchThreads + 4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._prefetcher.shutdown(cancel_futures=True)
+
+    def _localPath(self, sourcePath: pathlib.Path) -> pathlib.Path:
+        """local copies keep their filename (so abfID is unchanged) in a folder unique to their source"""
+        key = hashlib.sha1(str(sourcePath).encode()).hexdigest()[:16]
+        return self.folder.joinpath(key, sourcePath.name)
+
+    def _sidecarPath(self, localPath: pathlib.Path) -> pathlib.Path:
+        return localPath.with_name(localPath.name + ".json")
+
+    def _isCurrent(self, localPath: pathlib.Path, stat: os.stat_result) -> bool:
+        sidecarPath = self._sidecarPath(localPath)
+        if not (localPath.exists() and sidecarPath.exists()):
+            return False
+        try:
+            info = json.loads(sidecarPath.read_text())
+        except ValueError:
+            return False
+        return info["size"] == stat.st_size and \
+            info["mtime"] == stat.st_mtime and \
+            localPath.stat().st_size == stat.st_size
+
+    def _copy(self, sourcePath: pathlib.Path, localPath: pathlib.Path, stat: os.stat_result):
+        """
+        Copy a file into the mirror and confirm the copy is intact
+        before making it visible under its final name.
+        The partial copy is deleted if copying fails for any reason.
+        """
+        localPath.parent.mkdir(exist_ok=True)
+        tempPath = localPath.with_name(
+            f"{localPath.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        sourceHash = hashlib.sha1()
+        try:
+            with open(sourcePath, 'rb') as fSource, open(tempPath, 'wb') as fLocal:
+                for chunk in iter(lambda: fSource.read(1024 * 1024), b''):
+                    sourceHash.update(chunk)
+                    fLocal.write(chunk)
+            if tempPath.stat().st_size != stat.st_size:
+                raise IOError(f"incomplete copy of {sourcePath}")
+            if self.verify and getFileHash(tempPath) != sourceHash.hexdigest():
+                raise IOError(f"corrupted copy of {sourcePath}")
+            os.replace(tempPath, localPath)
+        finally:
+            tempPath.unlink(missing_ok=True)
+
+        info = {"source": str(sourcePath), "size": stat.st_size,
+                "mtime": stat.st_mtime, "sha1": sourceHash.hexdigest()}
+        atomicFiles.writeJson(self._sidecarPath(localPath), info)
+
+    def _resolve(self, sourcePath: pathlib.Path) -> pathlib.Path:
+        stat = sourcePath.stat()
+        localPath = self._localPath(sourcePath)
+        isCurrent = self._isCurrent(localPath, stat)
+        if isCurrent:
+            os.utime(self._sidecarPath(localPath))
+        else:
+            self._copy(sourcePath, localPath, stat)
+        self._recent.append(localPath)
+        if not isCurrent:
+            self.evict()
+        return localPath
+
+    def resolve(self, sourcePath) -> pathlib.Path:
+        """
+        Return the path to an up-to-date local copy of a file,
+        copying it (or waiting for a prefetch to finish) if needed.
+        """
+        sourcePath = pathlib.Path(sourcePath)
+        with self._lock:
+            future = self._pending.get(sourcePath)
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass  # try again in the foreground so the error is raised here
+        return self._resolve(sourcePath)
+
+    def prefetch(self, sourcePaths):
+        """
+        Start copying files on background threads.
+        """
+        for sourcePath in sourcePaths:
+            sourcePath = pathlib.Path(sourcePath)
+            with self._lock:
+                future = self._pending.get(sourcePath)
+                if future is not None and not future.done():
+                    continue
+                future = self._prefetcher.submit(self._resolve, sourcePath)
+                self._pending[sourcePath] = future
+            future.add_done_callback(
+                lambda x, path=sourcePath: self._forget(path, x))
+
+    def _forget(self, sourcePath: pathlib.Path, future: concurrent.futures.Future):
+        with self._lock:
+            if self._pending.get(sourcePath) is future:
+                del self._pending[sourcePath]
+
+    def iterate(self, sourcePaths, ahead: int = 2):
+        """
+        Yield local paths for every file in a work list
+        while the next files are copied in the background.
+        """
+        sourcePaths = list(sourcePaths)
+        for i, sourcePath in enumerate(sourcePaths):
+            self.prefetch(sourcePaths[i+1:i+1+ahead])
+            yield self.resolve(sourcePath)
+
+    def evict(self):
+        """
+        Delete the least recently used files until the mirror fits in its size limit.
+        Files this process resolved most recently are never deleted because they
+        may still be in use, so the limit may be briefly exceeded by a few files.
+        A file is last used when its sidecar was last touched, or when the file
+        itself was copied if its sidecar is missing (e.g., it failed to write).
+        """
+        with self._evictLock:
+            self._evict(set(self._recent))
+
+    def _evict(self, keep: set[pathlib.Path]):
+        entries = []
+        for localPath in self.folder.glob("*/*"):
+            if localPath.suffix in (".json", ".tmp"):
+                continue
+            sidecarPath = self._sidecarPath(localPath)
+            try:
+                size = localPath.stat().st_size
+                if sidecarPath.exists():
+                    lastUsed = sidecarPath.stat().st_mtime
+                else:
+                    lastUsed = localPath.stat().st_mtime
+            except OSError:
+                continue  # removed by another process
+            entries.append((lastUsed, str(localPath), size))
+        totalBytes = sum(x[2] for x in entries)
+        for _, localPath, size in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            localPath = pathlib.Path(localPath)
+            if localPath in keep:
+                continue
+            try:
+                localPath.unlink()
+            except OSError:
+                continue  # in use or already removed by another process
+            totalBytes -= size
+            try:
+                self._sidecarPath(localPath).unlink(missing_ok=True)
+                localPath.parent.rmdir()
+            except OSError:
+                pass  # another process is copying into this folder
+
+
+class PassthroughMirror:
+    """
+    Same interface as AbfMirror but files are used from their original location
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def close(self):
+        pass
+
+    def resolve(self, sourcePath) -> pathlib.Path:
+        return pathlib.Path(sourcePath)
+
+    def prefetch(self, sourcePaths):
+        pass
+
+    def iterate(self, sourcePaths, ahead: int = 2):
+        for sourcePath in sourcePaths:
+            yield pathlib.Path(sourcePath)
+
+
+def getFileHash(path: pathlib.Path) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+_mirror = None
+
+
+def getMirror():
+    """
+    Return the mirror configured by environment variables (shared within a process).
+    ABF_MIRROR_FOLDER sets the local folder and ABF_MIRROR_MAX_GB its size limit.
+    """
+    global _mirror
+    if _mirror is None:
+        folder = os.environ.get(MIRROR_FOLDER_VARIABLE)
+        if folder:
+            maxGigabytes = float(os.environ.get(MIRROR_SIZE_VARIABLE, 20))
+            _mirror = AbfMirror(folder, int(maxGigabytes * 1e9))
+        else:
+            _mirror = PassthroughMirror()
+    return _mirror
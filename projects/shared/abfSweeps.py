@@ -0,0 +1,15 @@
+"""
+This file contains helpers for working with the data of many sweeps at once.
+"""
+
+import numpy as np
+import pyabf
+
+
+def getSweepMatrix(abf: pyabf.ABF, channel: int = 0) -> np.ndarray:
+    """
+    Return the data of one channel as a (sweeps x points) array.
+    This is a view of the ABF's data so no sweep data is copied.
+    """
+    pointCount = abf.sweepCount * abf.sweepPointCount
+    return abf.data[channel, :pointCount].reshape(abf.sweepCount, abf.sweepPointCount)
@@ -0,0 +1,58 @@
+"""
+This file contains helpers for saving files atomically.
+
+Data is written to a temporary file in the destination folder which is then
+renamed over the destination, so other processes (and later runs after a crash)
+only ever see the previous file or the complete new one.
+"""
+
+import json
+import os
+import pathlib
+import threading
+
+
+def writeAtomic(path: pathlib.Path, writeFunction):
+    """
+    Call writeFunction with a binary file opened for writing, then move that file to path.
+    The temporary file is deleted if writing fails.
+    """
+    path = pathlib.Path(path)
+    tempPath = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tempPath, 'wb') as f:
+            writeFunction(f)
+        os.replace(tempPath, path)
+    finally:
+        tempPath.unlink(missing_ok=True)
+
+
+def writeBytes(path: pathlib.Path, data: bytes):
+    writeAtomic(path, lambda f: f.write(data))
+
+
+def writeText(path: pathlib.Path, text: str):
+    writeBytes(path, text.encode())
+
+
+def writeJson(path: pathlib.Path, data):
+    writeText(path, json.dumps(data, indent=1))
+
+
+def readVersionedJson(path: pathlib.Path, version: int) -> dict:
+    """
+    Return the data of a JSON file saved with a "version" key, or None if
+    the file does not exist, cannot be read, or was saved with another version.
+    """
+    path = pathlib.Path(path)
+    if not path.exists():
+        return None
+    try:
+        data = json.loads(path.read_text())
+    except ValueError:
+        print(f"WARNING - ignoring unreadable file: {path}")
+        return None
+    if data.get("version") != version:
+        return None
+    return data
@@ -0,0 +1,13 @@
+"""
+This file contains setup for worker processes that render matplotlib figures.
+"""
+
+import matplotlib.pyplot as plt
+
+
+def initWorker():
+    """
+    Switch pyplot to the Agg backend so a worker process can render and save
+    figures without a display. Pass this as a process pool's initializer.
+    """
+    plt.switch_backend("Agg")
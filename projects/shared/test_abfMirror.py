@@ -0,0 +1,103 @@
+import json
+import os
+import pytest
+import abfMirror
+
+
+def makeSource(folder, name, size, mtime):
+    path = folder.joinpath(name)
+    path.write_bytes(os.urandom(size))
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_copy_is_verified_and_keeps_filename(tmp_path):
+    source = makeSource(tmp_path, "2023_01_01_0000.abf", 1000, 1e9)
+    with abfMirror.AbfMirror(tmp_path.joinpath("mirror")) as mirror:
+        localPath = mirror.resolve(source)
+        assert localPath != source
+        assert localPath.name == source.name
+        assert localPath.read_bytes() == source.read_bytes()
+        info = json.loads(mirror._sidecarPath(localPath).read_text())
+        assert info["sha1"] == abfMirror.getFileHash(source)
+
+
+def test_unchanged_source_is_not_copied_again(tmp_path):
+    source = makeSource(tmp_path, "a.abf", 1000, 1e9)
+    with abfMirror.AbfMirror(tmp_path.joinpath("mirror")) as mirror:
+        localPath = mirror.resolve(source)
+        os.utime(localPath, (1, 1))
+        assert mirror.resolve(source) == localPath
+        assert localPath.stat().st_mtime == 1
+
+
+def test_changed_source_is_copied_again(tmp_path):
+    source = makeSource(tmp_path, "a.abf", 1000, 1e9)
+    with abfMirror.AbfMirror(tmp_path.joinpath("mirror")) as mirror:
+        localPath = mirror.resolve(source)
+        makeSource(tmp_path, "a.abf", 2000, 1e9 + 1)
+        assert mirror.resolve(source) == localPath
+        assert localPath.read_bytes() == source.read_bytes()
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    sources = [makeSource(tmp_path, f"{i}.abf", 1000, 1e9) for i in range(10)]
+    with abfMirror.AbfMirror(tmp_path.joinpath("mirror"), maxBytes=10_000) as mirror:
+        localPaths = [mirror.resolve(x) for x in sources]
+        for i, localPath in enumerate(localPaths):
+            os.utime(mirror._sidecarPath(localPath), (1e9 + i, 1e9 + i))
+
+        # the copy of this file has no sidecar so it is dated by the copy itself
+        orphan = localPaths[5]
+        mirror._sidecarPath(orphan).unlink()
+        os.utime(orphan, (1, 1))
+
+        mirror.maxBytes = 6_000
+        mirror._recent.clear()
+        mirror.evict()
+
+        assert [x.exists() for x in localPaths] == [False] * 3 + [True] * 2 + \
+            [False] + [True] * 4
+        assert not orphan.parent.exists()
+
+
+def test_recently_resolved_files_are_kept(tmp_path):
+    sources = [makeSource(tmp_path, f"{i}.abf", 1000, 1e9) for i in range(4)]
+    with abfMirror.AbfMirror(tmp_path.joinpath("mirror"), maxBytes=1) as mirror:
+        localPaths = [mirror.resolve(x) for x in sources]
+        assert len(set(mirror._recent)) == len(mirror._recent)
+        assert all(x.exists() for x in localPaths)
+
+
+class BrokenFile:
+    """a source file whose connection drops after the first read"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.readCount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def read(self, size):
+        self.readCount += 1
+        if self.readCount > 1:
+            raise OSError("connection lost")
+        return self.file.read(size)
+
+
+def test_failed_copy_leaves_no_temporary_file(tmp_path, monkeypatch):
+    source = makeSource(tmp_path, "a.abf", 3_000_000, 1e9)
+    realOpen = open
+
+    def openBroken(path, mode='r'):
+        return BrokenFile(path) if path == source else realOpen(path, mode)
+
+    monkeypatch.setattr(abfMirror, "open", openBroken, raising=False)
+    with abfMirror.AbfMirror(tmp_path.joinpath("mirror")) as mirror:
+        with pytest.raises(OSError):
+            mirror.resolve(source)
+    assert list(tmp_path.joinpath("mirror").glob("*/*")) == []
@@ -0,0 +1,68 @@
+"""
+This file contains min/max decimation for plotting long traces.
+
+A trace is divided into one bin per horizontal pixel and only the minimum
+and maximum point of each bin are kept (in their original order), so the
+plotted line looks the same as the full-resolution trace while using about
+2 points per pixel. Extreme values such as AP peaks and evoked minima are
+kept exactly, as are the first and last points. NaN gaps (e.g., blanked
+artifacts) remain gaps in the line.
+"""
+
+import numpy as np
+
+
+def getAxesPixelWidth(ax) -> int:
+    """Return the width of a matplotlib Axes in display pixels"""
+    return max(int(ax.get_window_extent().width), 1)
+
+
+def _getBinIndexes(values: np.ndarray) -> np.ndarray:
+    """
+    Return sorted indexes (into each row) of the minimum, maximum, and first NaN
+    of every row of a 2D array, as a 2D array with 3 columns.
+    """
+    isNan = np.isnan(values)
+    minIndexes = np.argmin(np.where(isNan, np.inf, values), axis=1)
+    maxIndexes = np.argmax(np.where(isNan, -np.inf, values), axis=1)
+    hasNan = np.any(isNan, axis=1)
+    nanIndexes = np.where(hasNan, np.argmax(isNan, axis=1), minIndexes)
+    return np.sort(np.stack([minIndexes, maxIndexes, nanIndexes], axis=1), axis=1)
+
+
+def decimateMinMax(xs: np.ndarray, ys: np.ndarray, pixelCount: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return a reduced copy of a trace that looks the same when plotted
+    pixelCount pixels wide. Traces that are already short enough are
+    returned unchanged.
+    """
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    pointCount = len(ys)
+    pixelCount = int(pixelCount)
+    if pixelCount < 1 or pointCount <= pixelCount * 2:
+        return xs, ys
+
+    binSize = int(np.ceil(pointCount / pixelCount))
+    fullBinCount = pointCount // binSize
+    fullBinPoints = fullBinCount * binSize
+
+    values = ys[:fullBinPoints].reshape(fullBinCount, binSize).astype(float)
+    indexes = _getBinIndexes(values) + \
+        np.arange(fullBinCount)[:, np.newaxis] * binSize
+    indexes = indexes.ravel()
+
+    if fullBinPoints < pointCount:
+        tail = ys[fullBinPoints:].reshape(1, -1).astype(float)
+        tailIndexes = _getBinIndexes(tail).ravel() + fullBinPoints
+        indexes = np.concatenate([indexes, tailIndexes])
+
+    # keep the first and last point so the trace spans the same horizontal range
+    indexes = np.concatenate([[0], indexes, [pointCount - 1]])
+
+    # bins without NaN (or with one extreme) repeat an index
+    isNew = np.ones(len(indexes), dtype=bool)
+    isNew[1:] = indexes[1:] != indexes[:-1]
+    indexes = indexes[isNew]
+
+    return xs[indexes], ys[indexes]
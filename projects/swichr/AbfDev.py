@@ -1,12 +1,34 @@
 import pyabf
+import pyabf.waveform
 import pathlib
+import warnings
 import numpy as np
 from dataclasses import dataclass
 
 
-@dataclass
+DIGITAL_OUTPUT_COUNT = 8
+
+
+def packDigitalStates(digitalStates: list[int]) -> int:
+    """Convert a list of digital output states into a bitmask (bit N is output N)"""
+    mask = 0
+    for i, state in enumerate(digitalStates):
+        if state:
+            mask |= 1 << i
+    return mask
+
+
+def unpackDigitalStates(digitalMask: int, outputCount: int = DIGITAL_OUTPUT_COUNT) -> list[int]:
+    """Convert a bitmask into a list of digital output states (0 or 1)"""
+    return [(int(digitalMask) >> i) & 1 for i in range(outputCount)]
+
+
+@dataclass(slots=True)
 class Epoch:
-    """Values of a single epoch column from an episodic waveform table"""
+    """
+    Values of a single epoch column from an episodic waveform table.
+    Digital output states are packed into a bitmask (bit N is output N).
+    """
     epochIndex: int
     firstIndex: int
     lastIndex: int
@@ -14,20 +36,30 @@ class Epoch:
     endTime: float
     duration: float
     level: float
-    epochType: int
+    epochType: str
     pulseWidth: float
     pulsePeriod: float
-    digitalStates: list[bool]
+    digitalMask: int
+
+    @property
+    def digitalStates(self) -> list[int]:
+        return unpackDigitalStates(self.digitalMask)
+
 
+def createEpochList(abf: pyabf.ABF, sweepEpochs=None) -> list[Epoch]:
+    """
+    Create an Epoch from the currently-loaded sweep
+    (or from the given pyabf.waveform.EpochSweepWaveform)
+    """
 
-def createEpochList(abf: pyabf.ABF) -> list[Epoch]:
-    """Create an Epoch from the currently-loaded sweep"""
+    if sweepEpochs is None:
+        sweepEpochs = abf.sweepEpochs
 
     epochs = []
-    epochCount = len(abf.sweepEpochs.p1s)
+    epochCount = len(sweepEpochs.p1s)
     for i in range(epochCount):
-        p1 = abf.sweepEpochs.p1s[i]
-        p2 = abf.sweepEpochs.p2s[i]
+        p1 = sweepEpochs.p1s[i]
+        p2 = sweepEpochs.p2s[i]
         t1 = p1 / abf.sampleRate
         t2 = p2 / abf.sampleRate
 
@@ -38,58 +70,483 @@ def createEpochList(abf: pyabf.ABF) -> list[Epoch]:
             startTime=t1,
             endTime=t2,
             duration=t2-t1,
-            level=abf.sweepEpochs.levels[i],
-            epochType=abf.sweepEpochs.types[i],
-            pulseWidth=abf.sweepEpochs.pulseWidths[i],
-            pulsePeriod=abf.sweepEpochs.pulsePeriods[i],
-            digitalStates=abf.sweepEpochs.digitalStates[i])
+            level=sweepEpochs.levels[i],
+            epochType=sweepEpochs.types[i],
+            pulseWidth=sweepEpochs.pulseWidths[i],
+            pulsePeriod=sweepEpochs.pulsePeriods[i],
+            digitalMask=packDigitalStates(sweepEpochs.digitalStates[i]))
 
         epochs.append(epoch)
     return epochs
 
 
+EPOCH_DTYPE = np.dtype([
+    ("epochIndex", np.int32),
+    ("firstIndex", np.int64),
+    ("lastIndex", np.int64),
+    ("startTime", np.float64),
+    ("endTime", np.float64),
+    ("duration", np.float64),
+    ("level", np.float64),
+    ("epochType", "U8"),
+    ("pulseWidth", np.int64),
+    ("pulsePeriod", np.int64),
+    ("digitalMask", np.uint8),
+])
+
+
+def createEpochListFromTable(epochTable: np.ndarray) -> list[Epoch]:
+    """Create Epoch objects from the rows of an epoch table (see EPOCH_DTYPE)"""
+    return [Epoch(*row) for row in epochTable.tolist()]
+
+
+def createWaveformFromTable(epochTable: np.ndarray) -> np.ndarray:
+    """
+    Create the command waveform of a sweep from its epoch table (see EPOCH_DTYPE)
+    with the same values as pyabf's EpochSweepWaveform.getWaveform()
+    """
+    waveform = np.full(epochTable["lastIndex"][-1], np.nan)
+    for i, epoch in enumerate(epochTable):
+        level = epoch["level"]
+        levelBefore = epochTable["level"][i-1] if i > 0 else level
+        levelDelta = level - levelBefore
+        chunkSize = epoch["lastIndex"] - epoch["firstIndex"]
+        pulsePeriod = epoch["pulsePeriod"]
+        pulseWidth = epoch["pulseWidth"]
+        pulseCount = int(chunkSize/pulsePeriod) if pulsePeriod > 0 else 0
+        epochType = str(epoch["epochType"])
+
+        if epochType == "Step":
+            chunk = np.full(chunkSize, level)
+        elif epochType == "Ramp":
+            chunk = np.linspace(levelBefore, level, chunkSize)
+        elif epochType == "Pulse":
+            chunk = np.full(chunkSize, levelBefore)
+            for pulse in range(pulseCount):
+                p1 = int(pulsePeriod*pulse)
+                chunk[p1:int(p1 + pulseWidth)] = level
+        elif epochType == "Tri":
+            chunk = np.full(chunkSize, np.nan)
+            for pulse in range(pulseCount):
+                p1 = int(pulsePeriod*pulse)
+                p2 = int(p1 + pulseWidth)
+                p3 = int(p1 + pulsePeriod)
+                chunk[p1:p2] = np.linspace(levelBefore, level, int(p2-p1))
+                chunk[p2:p3] = np.linspace(level, levelBefore, int(p3-p2))
+        elif epochType == "Cos":
+            chunk = np.full(chunkSize, levelBefore)
+            vals = np.linspace(0, 2*pulseCount*np.pi, len(chunk)) + np.pi
+            chunk += np.cos(vals) * levelDelta/2 + levelDelta/2
+        elif epochType == "BiPhsc":
+            chunk = np.full(chunkSize, levelBefore)
+            for pulse in range(pulseCount):
+                p1 = int(pulsePeriod*pulse)
+                p3 = int(p1 + pulseWidth)
+                p2 = int((p1+p3)/2)
+                chunk[p1:p2] = levelBefore + levelDelta
+                chunk[p2:p3] = levelBefore - levelDelta
+        else:
+            warnings.warn(f"Epoch type ({epochType}) unsupported")
+            chunk = np.full(chunkSize, np.nan)
+
+        waveform[epoch["firstIndex"]:epoch["lastIndex"]] = chunk
+    return waveform
+
+
+# values of nWaveformSource in the DAC section of the ABF header
+WAVEFORM_SOURCE_NONE = 0
+WAVEFORM_SOURCE_EPOCHS = 1
+WAVEFORM_SOURCE_FILE = 2
+
+
+@dataclass
+class DacHeader:
+    """
+    Waveform settings of one DAC read from the ABF header.
+    Epochs are pyabf.waveform.Epoch objects ("Off" epochs are removed).
+    """
+    holdingLevel: float
+    sweepPointCount: int
+    returnToHold: bool
+    waveformSource: int
+    epochs: list
+
+
+def readDacHeader(abf: pyabf.ABF, channel: int) -> DacHeader:
+    """
+    Read the waveform settings of one DAC from the header of an ABF.
+
+    pyabf keeps these in private header sections, so this is the only function
+    in this file that uses pyabf internals. If a pyabf release changes them
+    an error naming the pyabf version is raised here.
+    """
+    epochTable = object.__new__(pyabf.waveform.EpochTable)
+    try:
+        if abf.abfVersion["major"] == 1:
+            epochChannel = 0 if channel > 1 else channel
+            epochs = epochTable._initABF1(abf, epochChannel)
+            returnToHold = abf._headerV1.nInterEpisodeLevel[epochChannel]
+            dacHeader = abf._headerV1
+        elif abf.abfVersion["major"] == 2:
+            epochs = epochTable._initABF2(abf, channel)
+            returnToHold = abf._dacSection.nInterEpisodeLevel[channel]
+            dacHeader = abf._dacSection
+        else:
+            raise ValueError("ABF version not supported")
+        waveformSource = dacHeader.nWaveformSource[channel]
+        if not dacHeader.nWaveformEnable[channel]:
+            waveformSource = WAVEFORM_SOURCE_NONE
+    except AttributeError as e:
+        raise RuntimeError(
+            f"cannot read DAC settings with pyabf {pyabf.__version__}: {e}") from e
+
+    return DacHeader(
+        holdingLevel=abf.holdingCommand[channel],
+        sweepPointCount=abf.sweepPointCount,
+        returnToHold=bool(returnToHold),
+        waveformSource=int(waveformSource),
+        epochs=[x for x in epochs if x.epochType != 0])
+
+
+class ProtocolEpochs:
+    """
+    Epoch tables of one DAC channel for every sweep of a protocol.
+
+    The epoch table of a sweep is a NumPy structured array (see EPOCH_DTYPE)
+    with the same epochs pyabf reports in abf.sweepEpochs. When no epoch
+    changes from sweep to sweep (the usual case) a single read-only table
+    is shared by every sweep. Otherwise the table of each sweep is
+    calculated the first time it is requested.
+    """
+
+    def __init__(self, dacHeader: DacHeader, sampleRate: float):
+        epochs = dacHeader.epochs
+        self.sampleRate = sampleRate
+        self.sweepPointCount = dacHeader.sweepPointCount
+        self.holdingLevel = dacHeader.holdingLevel
+        self.returnToHold = dacHeader.returnToHold
+        self.waveformSource = dacHeader.waveformSource
+        self.levels = np.array([x.level for x in epochs], dtype=np.float64)
+        self.levelDeltas = np.array([x.levelDelta for x in epochs], dtype=np.float64)
+        self.durations = np.array([x.duration for x in epochs], dtype=np.int64)
+        self.durationDeltas = np.array([x.durationDelta for x in epochs], dtype=np.int64)
+        self.types = [x.epochTypeStr for x in epochs]
+        self.pulseWidths = [x.pulseWidth for x in epochs]
+        self.pulsePeriods = [x.pulsePeriod for x in epochs]
+        self.digitalMasks = [packDigitalStates(x.digitalPattern) for x in epochs]
+
+        # epochs that step in level or duration make every sweep different
+        self.isSweepInvariant = not (np.any(self.levelDeltas) or np.any(self.durationDeltas))
+
+        # returning to the last level makes the first sweep start differently
+        self._firstSweepDiffers = self.returnToHold and len(epochs) > 0 \
+            and self.levels[-1] != self.holdingLevel
+
+        self._tables = {}
+        self._waveforms = {}
+
+    def _getTableKey(self, sweepIndex: int) -> int:
+        if not self.isSweepInvariant:
+            return sweepIndex
+        if self._firstSweepDiffers:
+            return min(sweepIndex, 1)
+        return 0
+
+    def getTable(self, sweepIndex: int) -> np.ndarray:
+        """Return the read-only epoch table of a sweep"""
+        key = self._getTableKey(sweepIndex)
+        if not key in self._tables:
+            table = self._createTable(sweepIndex)
+            table.flags.writeable = False
+            self._tables[key] = table
+        return self._tables[key]
+
+    def getWaveform(self, sweepIndex: int) -> np.ndarray:
+        """
+        Return the read-only command waveform of a sweep created from its epoch table.
+        Waveforms are only kept when every sweep has the same epochs,
+        so stepped protocols do not hold one waveform per sweep in memory.
+        """
+        key = self._getTableKey(sweepIndex)
+        if key in self._waveforms:
+            return self._waveforms[key]
+        waveform = createWaveformFromTable(self.getTable(sweepIndex))
+        waveform.flags.writeable = False
+        if self.isSweepInvariant:
+            self._waveforms[key] = waveform
+        return waveform
+
+    def _createTable(self, sweepIndex: int) -> np.ndarray:
+        """calculate epoch positions and levels of a sweep like pyabf's EpochTable"""
+        epochCount = len(self.types)
+        durations = self.durations + self.durationDeltas * sweepIndex
+        levels = self.levels + self.levelDeltas * sweepIndex
+        preEpochEndPoint = int(self.sweepPointCount/64)
+        lastIndexes = preEpochEndPoint + np.cumsum(durations)
+
+        if self.returnToHold and epochCount and sweepIndex > 0:
+            preLevel = self.levels[-1] + self.levelDeltas[-1] * (sweepIndex - 1)
+        else:
+            preLevel = self.holdingLevel
+        if self.returnToHold and epochCount:
+            postLevel = levels[-1]
+        else:
+            postLevel = self.holdingLevel
+
+        table = np.zeros(epochCount + 2, dtype=EPOCH_DTYPE)
+        table["epochIndex"] = np.arange(epochCount + 2)
+        table["firstIndex"] = np.concatenate(
+            [[0, preEpochEndPoint], lastIndexes])
+        table["lastIndex"] = np.concatenate(
+            [[preEpochEndPoint], lastIndexes, [self.sweepPointCount]])
+        table["level"] = np.concatenate([[preLevel], levels, [postLevel]])
+        table["epochType"] = ["Step"] + self.types + ["Step"]
+        table["pulseWidth"][1:-1] = self.pulseWidths
+        table["pulsePeriod"][1:-1] = self.pulsePeriods
+        if epochCount:
+            table["digitalMask"][1:-1] = self.digitalMasks
+        table["startTime"] = table["firstIndex"] / self.sampleRate
+        table["endTime"] = table["lastIndex"] / self.sampleRate
+        table["duration"] = table["endTime"] - table["startTime"]
+        return table
+
+
+# protocol epochs shared by every ABF recorded with the same protocol
+_protocolEpochsCache = {}
+
+
+def getProtocolEpochs(abf: pyabf.ABF, channel: int = 0) -> ProtocolEpochs:
+    """
+    Return the epochs of an ABF's protocol for one DAC,
+    reusing those of a previously-seen ABF with an identical protocol.
+    """
+    dacHeader = readDacHeader(abf, channel)
+    key = (abf.sampleRate, dacHeader.sweepPointCount, dacHeader.holdingLevel,
+           dacHeader.returnToHold, dacHeader.waveformSource,
+           tuple((x.epochType, x.level, x.levelDelta, x.duration, x.durationDelta,
+                  x.pulseWidth, x.pulsePeriod, tuple(x.digitalPattern))
+                 for x in dacHeader.epochs))
+    if not key in _protocolEpochsCache:
+        _protocolEpochsCache[key] = ProtocolEpochs(dacHeader, abf.sampleRate)
+    return _protocolEpochsCache[key]
+
+
+class ScaledDataMap:
+    """
+    Read-only (channels x points) view of the data section of an ABF file.
+
+    The file is memory-mapped and nothing is read until it is indexed.
+    Indexing with [channel] or [channel, points] reads and scales only
+    the requested points, giving the same values as pyabf's abf.data.
+    """
+
+    def __init__(self, abf: pyabf.ABF):
+        pointsPerChannel = abf.dataPointCount // abf.channelCount
+        self.shape = (abf.channelCount, pointsPerChannel)
+        self.ndim = 2
+        self.dtype = np.dtype(np.float32)
+        self._raw = np.memmap(abf.abfFilePath, dtype=abf._dtype, mode='r',
+                              offset=abf.dataByteStart,
+                              shape=(pointsPerChannel, abf.channelCount))
+        self._isScaled = abf._dtype == np.int16
+        self._gains = list(abf._dataGain)
+        self._offsets = list(abf._dataOffset)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key) -> np.ndarray:
+        channel, points = key if isinstance(key, tuple) else (key, slice(None))
+        if not isinstance(channel, (int, np.integer)):
+            channels = range(self.shape[0])[channel]
+            return np.array([self[x, points] for x in channels])
+        values = np.array(self._raw[points, channel], dtype=np.float32)
+        if self._isScaled:
+            values = np.multiply(values, self._gains[channel])
+            values = np.add(values, self._offsets[channel])
+        return values
+
+
+def _getUnits(units: list[str], channel: int) -> str:
+    return str(units[channel]) if channel < len(units) else "None"
+
+
 class Sweep:
-    """ADC and DAC data for a single ABF sweep"""
+    """
+    ADC and DAC data for a single ABF sweep.
+
+    Sweeps are small: they store only their position in the ABF and a reference
+    to an epoch table shared with other sweeps. Everything else is derived.
+    Data is not copied: x is shared by every sweep of the ABF, y is read from
+    the ABF's data each time it is accessed (a view if the ABF is fully loaded,
+    scaled from disk if it is memory-mapped), and c is created from the epoch
+    table and shared by sweeps with identical epochs.
+    Epoch objects are created each time epochs is accessed,
+    so use epochTable when working with many sweeps.
+    """
 
-    def __init__(self, abf: pyabf.ABF, sweep: int, channel: int):
+    __slots__ = ("abf", "sweepIndex", "channel",
+                 "pointStart", "pointCount", "epochTable")
 
-        abf.setSweep(sweep, channel)
+    def __init__(self, abf: "AbfDev", sweep: int, channel: int):
 
-        self.sweep = sweep
+        if not sweep in abf.sweepList:
+            raise ValueError(
+                f"Sweep {sweep} not available (must be 0 - {abf.sweepCount-1})")
+        if not channel in abf.channelList:
+            raise ValueError(
+                f"Channel {channel} not available (must be 0 - {abf.channelCount-1})")
+
+        self.abf = abf
         self.sweepIndex = sweep
-        self.sweepNumber = sweep + 1
         self.channel = channel
+        self.pointStart, self.pointCount = abf.getSweepBounds(sweep)
+        self.epochTable = abf.getEpochTable(sweep, channel)
+
+    @property
+    def sweep(self) -> int:
+        return self.sweepIndex
 
-        self.x = abf.sweepX
-        self.x: np.ndarray
-        self.xUnits = str(abf.sweepUnitsX)
+    @property
+    def sweepNumber(self) -> int:
+        return self.sweepIndex + 1
 
-        self.y = abf.sweepY
-        self.y: np.ndarray
-        self.yUnits = str(abf.sweepUnitsY)
+    @property
+    def xUnits(self) -> str:
+        return "sec"
 
-        self.c = abf.sweepC
-        self.c: np.ndarray
-        self.cUnits = str(abf.sweepUnitsC)
+    @property
+    def yUnits(self) -> str:
+        return _getUnits(self.abf.adcUnits, self.channel)
 
-        self.path = pathlib.Path(abf.abfFilePath)
-        self.filename = self.path.name
-        self.sampleRate = int(abf.sampleRate)
-        self.startTime = float(abf.sweepIntervalSec * sweep)
-        self.epochs = createEpochList(abf)
+    @property
+    def cUnits(self) -> str:
+        return _getUnits(self.abf.dacUnits, self.channel)
+
+    @property
+    def path(self) -> pathlib.Path:
+        return pathlib.Path(self.abf.abfFilePath)
+
+    @property
+    def filename(self) -> str:
+        return self.path.name
+
+    @property
+    def sampleRate(self) -> int:
+        return int(self.abf.sampleRate)
+
+    @property
+    def startTime(self) -> float:
+        return float(self.abf.sweepIntervalSec * self.sweepIndex)
+
+    @property
+    def epochs(self) -> list[Epoch]:
+        return createEpochListFromTable(self.epochTable)
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.abf.getSweepX(self.pointCount)
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.getY()
+
+    @property
+    def c(self) -> np.ndarray:
+        return self.abf.getSweepC(self.sweepIndex, self.channel)
+
+    def getY(self, index1: int = 0, index2: int = None) -> np.ndarray:
+        """
+        Return recorded values between two indexes of this sweep.
+        For memory-mapped ABFs only these points are read from disk.
+        """
+        index1, index2, _ = slice(index1, index2).indices(self.pointCount)
+        return self.abf.data[self.channel,
+                             self.pointStart + index1:self.pointStart + index2]
 
     def __repr__(self):
-        return f"{self.path.name} Sweep {self.sweep} (Ch{self.channel})"
+        return f"{self.filename} Sweep {self.sweepIndex} (Ch{self.channel})"
 
 
 class AbfDev(pyabf.ABF):
-    """Experimental version of the ABF class used to propose new functionality"""
+    """
+    Experimental version of the ABF class used to propose new functionality.
 
-    def __init__(self, abfFilePath):
-        super().__init__(abfFilePath)
+    If memoryMap is True the header is read but data is not loaded into memory.
+    Instead abf.data is a ScaledDataMap that reads values from disk as they
+    are indexed, so sweeps of very large files can be used with bounded memory.
+    """
+
+    def __init__(self, abfFilePath, memoryMap: bool = False):
+        super().__init__(abfFilePath, loadData=not memoryMap)
+        if memoryMap:
+            self.data = ScaledDataMap(self)
+        self._sweepXs = {}
+        self._protocolEpochs = {}
+        self._sweepLengths = None
+        if hasattr(self, "_synchArraySection"):
+            lengths = self._synchArraySection.lLength
+            if len(set(lengths)) > 1:
+                self._sweepLengths = lengths
+
+    def getSweepBounds(self, sweepIndex: int) -> tuple[int, int]:
+        """Return the first data index and point count of a sweep"""
+        if self._sweepLengths is not None:
+            pointStart = sum(self._sweepLengths[:sweepIndex]) // self.channelCount
+            return pointStart, self._sweepLengths[sweepIndex] // self.channelCount
+        return self.sweepPointCount * sweepIndex, self.sweepPointCount
+
+    def getSweepX(self, pointCount: int = None) -> np.ndarray:
+        """Return sweep times (seconds) as a read-only array shared between sweeps"""
+        if pointCount is None:
+            pointCount = self.sweepPointCount
+        if not pointCount in self._sweepXs:
+            xs = np.arange(pointCount) * self.dataSecPerPoint
+            xs.flags.writeable = False
+            self._sweepXs[pointCount] = xs
+        return self._sweepXs[pointCount]
+
+    def _getProtocolEpochs(self, channelIndex: int) -> ProtocolEpochs:
+        """return the protocol epochs of a DAC (None if there is no such DAC)"""
+        if not channelIndex in self._protocolEpochs:
+            if channelIndex < len(self.holdingCommand):
+                self._protocolEpochs[channelIndex] = getProtocolEpochs(
+                    self, channelIndex)
+            else:
+                self._protocolEpochs[channelIndex] = None
+        return self._protocolEpochs[channelIndex]
+
+    def getEpochTable(self, sweepIndex: int, channelIndex: int = 0) -> np.ndarray:
+        """Return the epoch table (see EPOCH_DTYPE) of a sweep without loading the sweep"""
+        protocolEpochs = self._getProtocolEpochs(channelIndex)
+        if protocolEpochs is None:
+            return np.zeros(0, dtype=EPOCH_DTYPE)
+        return protocolEpochs.getTable(sweepIndex)
+
+    def getSweepC(self, sweepIndex: int, channelIndex: int = 0) -> np.ndarray:
+        """
+        Return the command waveform of a sweep (the same values as pyabf's sweepC).
+        Waveforms made of epochs are created from the cached epoch table.
+        Other waveforms (disabled, from a file, or of variable-length sweeps) come from pyabf.
+        """
+        protocolEpochs = self._getProtocolEpochs(channelIndex)
+        if protocolEpochs is None or self._sweepLengths is not None or \
+                protocolEpochs.waveformSource != WAVEFORM_SOURCE_EPOCHS:
+            stimulus = self.stimulusByChannel[channelIndex]
+            return stimulus.stimulusWaveform(sweepIndex)[:self.getSweepBounds(sweepIndex)[1]]
+        return protocolEpochs.getWaveform(sweepIndex)
+
+    def getEpochList(self, sweepIndex: int, channelIndex: int = 0) -> list[Epoch]:
+        """Return epochs of a sweep without loading the sweep"""
+        return createEpochListFromTable(self.getEpochTable(sweepIndex, channelIndex))
 
     def getSweep(self, sweepIndex: int, channelIndex: int = 0) -> Sweep:
         return Sweep(self, sweepIndex, channelIndex)
 
     def getSweeps(self, channelIndex: int = 0) -> list[Sweep]:
-        return [self.getSweep(sweepIndex, channelIndex) for sweepIndex in range(abf.sweepCount)]
+        return [self.getSweep(sweepIndex, channelIndex) for sweepIndex in range(self.sweepCount)]
+
+    def iterSweeps(self, channelIndex: int = 0):
+        """Yield one sweep at a time"""
+        for sweepIndex in range(self.sweepCount):
+            yield self.getSweep(sweepIndex, channelIndex)
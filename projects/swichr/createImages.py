@@ -1,77 +1,190 @@
-import pyabf
-import matplotlib
-import matplotlib.pyplot as plt
-from AbfDev import AbfDev, Sweep, Epoch
+import concurrent.futures
+import os
+import matplotlib.figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from AbfDev import AbfDev, Sweep
 import pathlib
+import sys
+import stimulusScreening
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import abfMirror  # nopep8
+import traceDecimation  # nopep8
 
+BLINK_COLORS = ["blue", "red"]
 
-def saveSwichrSweepImages(abfPath: pathlib.Path):
-    abf = AbfDev(abfPath)
+
+class SweepImageRenderer:
+    """
+    Draws sweeps by updating a single figure instead of creating a new one for each sweep.
+
+    The figure, axes, labels, and layout are created once (when the first sweep is drawn,
+    and again only if axis labels change when the renderer is reused for another ABF)
+    and each sweep only replaces line data, axis limits, the title, and the spans shading
+    digital output epochs. Spans are kept if the next sweep shares the same epoch table.
+    Traces are reduced to the min and max of each horizontal pixel before plotting.
+    Figures are drawn with the Agg canvas directly so pyplot is never used.
+    """
+
+    def __init__(self):
+        self.fig = matplotlib.figure.Figure(figsize=(8, 6))
+        FigureCanvasAgg(self.fig)
+        gs = self.fig.add_gridspec(2, hspace=0)
+        self.axs = gs.subplots(sharex=True)
+
+        self.lineY, = self.axs[0].plot([], [], color='b')
+        self.lineC, = self.axs[1].plot([], [], color='r')
+        self.axs[0].margins(0, .1)
+
+        for ax in self.axs:
+            ax.grid(alpha=.5, ls='--')
+            ax.label_outer()
+
+        self.title = self.fig.suptitle("")
+        self.spans = []
+        self.spanEpochTable = None
+        self.isLayoutDone = False
+
+    def _setSpans(self, epochTable):
+        if epochTable is self.spanEpochTable:
+            return
+        for span in self.spans:
+            span.remove()
+        self.spans = []
+        digitalEpochs = epochTable[epochTable["digitalMask"] != 0]
+        for i, (startTime, endTime) in enumerate(zip(digitalEpochs["startTime"], digitalEpochs["endTime"])):
+            color = BLINK_COLORS[i % len(BLINK_COLORS)]
+            for ax in self.axs:
+                self.spans.append(ax.axvspan(startTime, endTime,
+                                             alpha=.2, color=color, lw=0))
+        self.spanEpochTable = epochTable
+
+    def save(self, sweep: Sweep, saveAs: pathlib.Path):
+        xs = sweep.x
+        pixelCount = traceDecimation.getAxesPixelWidth(self.axs[0])
+        self.lineY.set_data(*traceDecimation.decimateMinMax(xs, sweep.y, pixelCount))
+        self.lineC.set_data(*traceDecimation.decimateMinMax(xs, sweep.c, pixelCount))
+        self._setSpans(sweep.epochTable)
+
+        labels = (f"Recording ({sweep.yUnits})", f"Command ({sweep.cUnits})")
+        if labels != (self.axs[0].get_ylabel(), self.axs[1].get_ylabel()):
+            self.axs[0].set_ylabel(labels[0])
+            self.axs[1].set_ylabel(labels[1])
+            self.isLayoutDone = False
+        self.title.set_text(f"{sweep.filename} sweep {sweep.sweepNumber}")
+        for ax in self.axs:
+            ax.relim()
+            ax.autoscale_view()
+
+        if not self.isLayoutDone:
+            self.fig.tight_layout()
+            self.isLayoutDone = True
+
+        self.fig.savefig(saveAs)
+        print(f"Saved: {saveAs}")
+
+
+# sweeps are only divided between processes if each gets at least this many
+MIN_SWEEPS_PER_WORKER = 8
+
+_renderer = None
+
+
+def _getRenderer() -> SweepImageRenderer:
+    """return a renderer that is shared by every ABF drawn in this process"""
+    global _renderer
+    if _renderer is None:
+        _renderer = SweepImageRenderer()
+    return _renderer
+
+
+def _makeOutputFolder() -> pathlib.Path:
     outputFolder = pathlib.Path("./output")
     if not outputFolder.exists():
         outputFolder.mkdir()
-    for sweepIndex in range(abf.sweepCount):
-        sw = abf.getSweep(sweepIndex)
+    return outputFolder
+
+
+def _saveSweepImages(abfPath: pathlib.Path, sweepIndexes: list[int] = None):
+    """
+    Render a group of sweeps (or every sweep) of an ABF with this process's renderer.
+    The ABF is resolved through the mirror here (rather than by the caller)
+    so worker processes read it from a local copy.
+    """
+    abf = AbfDev(abfMirror.getMirror().resolve(abfPath), memoryMap=True)
+    if sweepIndexes is None:
+        sweepIndexes = range(abf.sweepCount)
+    renderer = _getRenderer()
+    for sweepIndex in sweepIndexes:
         saveAs = pathlib.Path(f"./output/{abf.abfID}-sw{sweepIndex}.png")
-        saveSwichrSweepImage(sw, saveAs)
+        renderer.save(abf.getSweep(sweepIndex), saveAs)
 
 
-def saveSwichrSweepImage(sweep: Sweep, saveAs: pathlib.Path):
+def saveSwichrSweepImages(abfPath: pathlib.Path, workers: int = 1):
+    """
+    Save an image of every sweep in an ABF.
+    Sweeps are divided between up to this many worker processes, but only if
+    each worker gets at least MIN_SWEEPS_PER_WORKER sweeps (otherwise starting
+    processes costs more than it saves and sweeps are rendered here).
+    """
+    _makeOutputFolder()
+    sweepCount = AbfDev(abfMirror.getMirror().resolve(abfPath), memoryMap=True).sweepCount
+    workers = min(workers, sweepCount // MIN_SWEEPS_PER_WORKER)
+    if workers <= 1:
+        _saveSweepImages(abfPath)
+        return
 
-    fig = plt.figure(figsize=(8, 6))
-    gs = fig.add_gridspec(2, hspace=0)
-    axs = gs.subplots(sharex=True)
+    sweepIndexes = list(range(sweepCount))
+    chunkSize = -(-sweepCount // workers)
+    chunks = [sweepIndexes[i:i+chunkSize]
+              for i in range(0, sweepCount, chunkSize)]
+    with concurrent.futures.ProcessPoolExecutor(len(chunks)) as executor:
+        futures = [executor.submit(_saveSweepImages, abfPath, x) for x in chunks]
+        for future in futures:
+            future.result()
 
-    axs[0].plot(sweep.x, sweep.y, color='b')
-    axs[1].plot(sweep.x, sweep.c, color='r')
-    axs[0].margins(0, .1)
 
-    axs[0].set_ylabel(f"Recording ({sweep.yUnits})")
-    axs[1].set_ylabel(f"Command ({sweep.cUnits})")
+def saveSwichrSweepImagesForAbfs(abfPaths: list[pathlib.Path], workers: int = 1):
+    """
+    Save an image of every sweep of every ABF.
+    One pool of worker processes is shared by all ABFs and each ABF is drawn
+    entirely by one worker, so processes and renderers are reused between ABFs.
+    ABFs are copied into the mirror (see abfMirror.getMirror) a few files
+    ahead, and each is handed to a worker once its local copy is ready.
+    """
+    _makeOutputFolder()
+    abfPaths = list(abfPaths)
+    readyAbfPaths = (abfPath for abfPath, localPath in
+                     zip(abfPaths, abfMirror.getMirror().iterate(abfPaths)))
+    if workers <= 1 or len(abfPaths) < 2:
+        for abfPath in readyAbfPaths:
+            saveSwichrSweepImages(abfPath, workers)
+        return
 
-    colorIndex = 0
-    blinkColors = ["blue", "red"]
-    for i, epoch in enumerate(sweep.epochs):
-        if (sum(epoch.digitalStates) == 0):
-            continue
-        color = blinkColors[colorIndex]
-        colorIndex += 1
-        for ax in axs:
-            ax.axvspan(epoch.startTime, epoch.endTime,
-                       alpha=.2, color=color, lw=0)
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(abfPaths))) as executor:
+        futures = [executor.submit(_saveSweepImages, x) for x in readyAbfPaths]
+        for future in futures:
+            future.result()
 
-    for ax in axs:
-        ax.grid(alpha=.5, ls='--')
-        ax.label_outer()
 
-    plt.suptitle(f"{sweep.filename} sweep {sweep.sweepNumber}")
-    plt.tight_layout()
-    plt.savefig(saveAs)
-    print(f"Saved: {saveAs}")
-    # plt.show()
-    plt.close()
+def saveSwichrSweepImage(sweep: Sweep, saveAs: pathlib.Path):
+    SweepImageRenderer().save(sweep, saveAs)
 
 
 def getAbfsWithStimuli(abfFolderPath: str) -> list[pathlib.Path]:
     abfPaths = []
-    abfFolderPath = pathlib.Path(abfFolderPath)
-    for abfFilePath in abfFolderPath.glob("*.abf"):
-        abf = pyabf.ABF(abfFilePath)
-        if abf.sweepCount > 5:
+    for screening in stimulusScreening.screenFolder(abfFolderPath):
+        if screening.sweepCount > 5:
             continue  # ignore drug application and sIPSC experiments
-        digSumByEpoch = [sum(x) for x in abf.sweepEpochs.digitalStates]
-        digitalOutputsAreToggled = len(set(digSumByEpoch)) > 1
-        print(f"digital outputs in {abf.abfID}: {digitalOutputsAreToggled}")
-        if (digitalOutputsAreToggled):
-            abfPaths.append(abfFilePath)
+        print(f"digital outputs in {screening.abfID}: {screening.digitalOutputsAreToggled}")
+        if (screening.digitalOutputsAreToggled):
+            abfPaths.append(pathlib.Path(screening.path))
     return abfPaths
 
 
 if __name__ == "__main__":
     abfFolder = "X:/Data/AT2-Cre/ACC-ChR2-or-CwiChRca/experiments/demonstrate-SwiChRca"
     abfPaths = getAbfsWithStimuli(abfFolder)
-    for abfPath in abfPaths:
-        saveSwichrSweepImages(abfPath)
+    saveSwichrSweepImagesForAbfs(abfPaths, workers=os.cpu_count())
 
     # TODO: ignore these
     # 2022_04_19_0023
@@ -1,4 +1,23 @@
+"""
+This script builds a static website to browse sweep images in ./output
+
+Each ABF gets its own page (linked from index.html and to its neighbors)
+showing lazy-loaded thumbnails that link to the full-size images.
+Thumbnails are only regenerated when their image is newer, and a manifest
+records what each page was built from so only pages whose images changed
+are written again.
+"""
+
 import pathlib
+import sys
+import matplotlib.image
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import atomicFiles  # nopep8
+
+SITE_VERSION = 1
+MANIFEST_FILENAME = "site.json"
+THUMBNAIL_FOLDER_NAME = "thumbnails"
+THUMBNAIL_SCALE = 0.25
 
 template = """
 <!doctype html>
@@ -7,7 +26,7 @@ template = """
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1">
     <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-    <title>SwiChR Sweeps</title>
+    <title>TITLE</title>
     <style>
       a {text-decoration: none; color: black;}
       a:hover {text-decoration: underline;}
@@ -15,7 +34,7 @@ template = """
   </head>
   <body>
     <div class="container">
-      <h1 class="my-5">SwiChR Sweeps</h1>
+      <h1 class="my-5">TITLE</h1>
       CONTENT
     </div>
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js" integrity="sha384-ka7Sk0Gln4gmtz2MlQnikT1wXgYsOg+OMhuP+IlRH9sENBO0LRn5q+8nbTov4+1p" crossorigin="anonymous"></script>
@@ -23,19 +42,137 @@ template = """
 </html>
 """
 
-if __name__ == "__main__":
 
-    outputFolder = pathlib.Path("./output")
-    imageFilenames = [x.name for x in outputFolder.glob("*.png")]
-    html = ""
+def getImagesByAbf(outputFolder: pathlib.Path) -> dict[str, list[pathlib.Path]]:
+    """
+    Return sweep images (named like ABFID-sw0.png) grouped by ABF ID
+    with ABFs sorted by name and images sorted by sweep.
+    """
+    imagesByAbf = {}
+    for imagePath in outputFolder.glob("*-sw*.png"):
+        abfID, sweepIndex = imagePath.stem.rsplit("-sw", 1)
+        if sweepIndex.isdigit():
+            imagesByAbf.setdefault(abfID, []).append(
+                (int(sweepIndex), imagePath))
+    return {abfID: [x[1] for x in sorted(imagesByAbf[abfID])]
+            for abfID in sorted(imagesByAbf)}
+
+
+def updateThumbnail(imagePath: pathlib.Path, thumbnailPath: pathlib.Path) -> bool:
+    """
+    Create a downscaled copy of an image unless an up-to-date one exists.
+    Returns True if the thumbnail was created.
+    """
+    if thumbnailPath.exists() and thumbnailPath.stat().st_mtime >= imagePath.stat().st_mtime:
+        return False
+    atomicFiles.writeAtomic(thumbnailPath, lambda f: matplotlib.image.thumbnail(
+        imagePath, f, scale=THUMBNAIL_SCALE))
+    return True
+
+
+def getAbfPageHtml(abfID: str, imagePaths: list[pathlib.Path],
+                   previousAbfID: str, nextAbfID: str) -> str:
+    """
+    Return the HTML of a page showing every sweep image of one ABF.
+    """
+    links = ["<a href='index.html'>index</a>"]
+    if previousAbfID:
+        links.append(f"<a href='{previousAbfID}.html'>&larr; {previousAbfID}</a>")
+    if nextAbfID:
+        links.append(f"<a href='{nextAbfID}.html'>{nextAbfID} &rarr;</a>")
+    navigation = "<div class='my-3'>" + " | ".join(links) + "</div>"
+
+    parts = [navigation]
+    for imagePath in imagePaths:
+        filename = imagePath.name
+        anchor = imagePath.stem
+        sweepNumber = int(anchor.rsplit("-sw", 1)[1]) + 1
+        parts.append(f"<h3 class='mt-5' id='{anchor}'><a href='#{anchor}'>"
+                     f"{abfID}.abf sweep {sweepNumber}</a></h3>")
+        parts.append(f"<a href='{filename}'><img src='{THUMBNAIL_FOLDER_NAME}/{filename}' "
+                     f"loading='lazy' alt='{anchor}' /></a>")
+    parts.append(navigation)
+
+    return template.replace("TITLE", f"{abfID} Sweeps").replace("CONTENT", "\n".join(parts))
+
+
+def getIndexHtml(imagesByAbf: dict[str, list[pathlib.Path]]) -> str:
+    """
+    Return the HTML of a page linking to every ABF page.
+    """
+    parts = ["<ul>"]
+    for abfID, imagePaths in imagesByAbf.items():
+        parts.append(f"<li><a href='{abfID}.html'>{abfID}</a> ({len(imagePaths)} sweeps)</li>")
+    parts.append("</ul>")
+    return template.replace("TITLE", "SwiChR Sweeps").replace("CONTENT", "\n".join(parts))
+
+
+def _loadManifest(manifestPath: pathlib.Path) -> dict:
+    data = atomicFiles.readVersionedJson(manifestPath, SITE_VERSION)
+    return {} if data is None else data["pages"]
 
-    for filename in imageFilenames:
-        anchor = filename[:-4]
-        filenameAbf = filename.split("-sw")[0]+".abf"
-        sweepNumber =  int(filename.split("-sw")[1][:-4]) + 1
-        html += f"<h3 class='mt-5' id='{anchor}'><a href='#{anchor}'>{filenameAbf} sweep {sweepNumber}</a></h3>"
-        html += f"<a href='{filename}'><img src='{filename}' /></a>"
-        print(filename)
 
-    html = template.replace("CONTENT", html)
-    pathlib.Path("./output/index.html").write_text(html)
+def _saveManifest(manifestPath: pathlib.Path, pages: dict):
+    atomicFiles.writeJson(manifestPath, {"version": SITE_VERSION, "pages": pages})
+
+
+def _writePage(path: pathlib.Path, html: str):
+    atomicFiles.writeText(path, html)
+    print(path)
+
+
+def buildSite(outputFolder: pathlib.Path):
+    """
+    Create or update thumbnails, ABF pages, and the index page.
+    Pages are only written if their images (or neighboring ABFs) changed.
+    """
+    thumbnailFolder = outputFolder.joinpath(THUMBNAIL_FOLDER_NAME)
+    if not thumbnailFolder.exists():
+        thumbnailFolder.mkdir()
+
+    manifestPath = outputFolder.joinpath(MANIFEST_FILENAME)
+    builtPages = _loadManifest(manifestPath)
+    imagesByAbf = getImagesByAbf(outputFolder)
+    abfIDs = list(imagesByAbf)
+
+    pages = {}
+    for i, abfID in enumerate(abfIDs):
+        imagePaths = imagesByAbf[abfID]
+        previousAbfID = abfIDs[i-1] if i > 0 else None
+        nextAbfID = abfIDs[i+1] if i + 1 < len(abfIDs) else None
+
+        for imagePath in imagePaths:
+            updateThumbnail(imagePath, thumbnailFolder.joinpath(imagePath.name))
+
+        images = []
+        for imagePath in imagePaths:
+            stat = imagePath.stat()
+            images.append([imagePath.name, stat.st_size, stat.st_mtime])
+        pages[abfID] = {"images": images,
+                        "previous": previousAbfID, "next": nextAbfID}
+
+        pagePath = outputFolder.joinpath(abfID + ".html")
+        if builtPages.get(abfID) != pages[abfID] or not pagePath.exists():
+            _writePage(pagePath, getAbfPageHtml(abfID, imagePaths,
+                                                previousAbfID, nextAbfID))
+
+    # remove pages and thumbnails whose images were deleted
+    for abfID, builtPage in builtPages.items():
+        if not abfID in pages:
+            outputFolder.joinpath(abfID + ".html").unlink(missing_ok=True)
+        currentImages = set(x[0] for x in pages.get(abfID, {"images": []})["images"])
+        for image in builtPage["images"]:
+            if not image[0] in currentImages:
+                thumbnailFolder.joinpath(image[0]).unlink(missing_ok=True)
+
+    indexPath = outputFolder.joinpath("index.html")
+    indexChanged = [(k, len(v["images"])) for k, v in builtPages.items()] != \
+        [(k, len(v["images"])) for k, v in pages.items()]
+    if indexChanged or not indexPath.exists():
+        _writePage(indexPath, getIndexHtml(imagesByAbf))
+
+    _saveManifest(manifestPath, pages)
+
+
+if __name__ == "__main__":
+    buildSite(pathlib.Path("./output"))
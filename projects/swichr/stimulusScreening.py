@@ -0,0 +1,108 @@
+"""
+This file screens a folder of ABFs for experiments that toggle digital outputs.
+
+Only ABF headers are read (the stimulus waveform is described entirely by the
+header) and headers are read on a thread pool because the work is limited by
+network latency rather than CPU. Results are cached as JSON keyed by ABF path
+and are reused as long as the file's size and modification time are unchanged.
+"""
+
+import concurrent.futures
+import os
+import pathlib
+import sys
+import pyabf
+from dataclasses import dataclass, asdict
+from AbfDev import getProtocolEpochs
+sys.path.append(str(pathlib.Path(__file__).parents[1].joinpath("shared")))
+import atomicFiles  # nopep8
+
+SCREENING_VERSION = 1
+SCREENING_CACHE_PATH = pathlib.Path("./output/stimulusScreening.json")
+
+
+@dataclass
+class StimulusScreening:
+    """
+    Stimulus classification of a single ABF file
+    """
+    path: str
+    size: int
+    mtime: float
+    abfID: str
+    sweepCount: int
+    digitalOutputsAreToggled: bool
+
+
+def screenAbf(abfPath: pathlib.Path, stat: os.stat_result) -> StimulusScreening:
+    """
+    Read the header of an ABF and determine whether the first sweep
+    has epochs with different numbers of active digital outputs.
+    """
+    abf = pyabf.ABF(abfPath, loadData=False)
+    if len(abf.holdingCommand) > 0:
+        digitalMasks = getProtocolEpochs(abf, 0).getTable(0)["digitalMask"]
+    else:
+        digitalMasks = []
+    digSumByEpoch = [bin(int(x)).count("1") for x in digitalMasks]
+    return StimulusScreening(
+        path=str(abfPath),
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        abfID=abf.abfID,
+        sweepCount=int(abf.sweepCount),
+        digitalOutputsAreToggled=len(set(digSumByEpoch)) > 1)
+
+
+def _loadCacheFile(cachePath: pathlib.Path) -> dict[str, StimulusScreening]:
+    data = atomicFiles.readVersionedJson(cachePath, SCREENING_VERSION)
+    if data is None:
+        return {}
+    return {x["path"]: StimulusScreening(**x) for x in data["abfs"]}
+
+
+def _saveCacheFile(cachePath: pathlib.Path, screenings: dict[str, StimulusScreening]):
+    if not cachePath.parent.exists():
+        cachePath.parent.mkdir(parents=True)
+    atomicFiles.writeJson(cachePath, {"version": SCREENING_VERSION,
+                                      "abfs": [asdict(x) for x in screenings.values()]})
+
+
+def screenFolder(folder: pathlib.Path, threads: int = 16,
+                 cachePath: pathlib.Path = SCREENING_CACHE_PATH) -> list[StimulusScreening]:
+    """
+    Return the stimulus classification of every ABF in the folder sorted by filename.
+    Only ABFs that are new or modified since the cache was saved have their headers read.
+    """
+    folder = pathlib.Path(folder)
+    cached = _loadCacheFile(cachePath)
+
+    with os.scandir(folder) as entries:
+        abfEntries = sorted([x for x in entries
+                             if x.is_file() and x.name.lower().endswith(".abf")],
+                            key=lambda x: x.name)
+
+    screenings = {}
+    toRead = []
+    for entry in abfEntries:
+        path = str(folder.joinpath(entry.name))
+        stat = entry.stat()
+        screening = cached.get(path)
+        if screening and screening.size == stat.st_size and screening.mtime == stat.st_mtime:
+            screenings[path] = screening
+        else:
+            toRead.append((pathlib.Path(path), stat))
+
+    if toRead:
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            futures = [executor.submit(screenAbf, path, stat)
+                       for path, stat in toRead]
+            for future in futures:
+                screening = future.result()
+                screenings[screening.path] = screening
+
+    cached.update(screenings)
+    if toRead:
+        _saveCacheFile(cachePath, cached)
+
+    return [screenings[str(folder.joinpath(x.name))] for x in abfEntries]